@@ -0,0 +1,317 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Translates VM commands straight into Hack assembly. Instead of a fixed
+template per command, short sequences are translated together: an operand
+that is pushed only to be consumed by the next command is loaded into D and
+never touches the stack, and comparisons feeding an if-goto jump on the
+difference directly. Calls and returns jump to shared routines emitted once
+per program, which keeps the code of every call site short.
+
+R13 and R14 are scratch registers of the translation, and R15 holds return
+addresses of the runtime routines. Comparisons compute x - y, so like most
+VM translators they are wrong when the difference overflows.
+"""
+import typing
+from VMWriter import VMWriter
+
+SEGMENT_POINTERS = {"local": "LCL", "argument": "ARG", "this": "THIS",
+                    "that": "THAT"}
+# Offsets up to this are reached by incrementing A, larger ones are added.
+MAX_INCREMENTS = 6
+BINARY_OPERATIONS = {"add": "D+M", "sub": "M-D", "and": "D&M", "or": "D|M"}
+UNARY_OPERATIONS = {"neg": "-M", "not": "!M"}
+JUMPS = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}
+INVERTED_JUMPS = {"eq": "JNE", "gt": "JLE", "lt": "JGE"}
+PUSH_D = ["@SP", "AM=M+1", "A=A-1", "M=D"]
+POP_D = ["@SP", "AM=M-1", "D=M"]
+CALL_ROUTINE = "$$CALL"
+RETURN_ROUTINE = "$$RETURN"
+SHIFTRIGHT_ROUTINE = "$$SHIFTRIGHT"
+STACK_BASE = 256
+
+
+class AsmWriter(VMWriter):
+    """Writes Hack assembly into a file, behind the interface of VMWriter.
+
+    The VM commands of a subroutine are still collected and run through the
+    passes like in VMWriter. Only when the subroutine ends are they
+    translated, so every optimization of the VM code applies to both
+    backends. A complete program also needs write_bootstrap and
+    write_runtime, once.
+    """
+
+    def __init__(self, output_stream: typing.TextIO) -> None:
+        """Creates a new file and prepares it for writing Hack assembly."""
+        super().__init__(output_stream)
+        self.function = ""
+        self.class_name = ""
+        self.label_counter = 0
+
+    def end_subroutine(self) -> None:
+        """Runs the commands of the current subroutine through the passes,
+        translates them and queues the assembly for writing.
+        """
+        if not self.instructions:
+            return
+        instructions = self.instructions
+        for rewrite in self.passes:
+            instructions = rewrite(instructions)
+        self.instructions = []
+        self._queue(self.translate(instructions))
+
+    def _queue(self, lines: typing.List[str]) -> None:
+        block = "\n".join(lines) + "\n" if lines else ""
+        self.pending.append(block)
+        self.pending_size += len(block)
+
+    def write_vm(self, vm_code: str) -> None:
+        """Translates VM code that was compiled before, such as the classes
+        of the OS.
+
+        Args:
+            vm_code (str): VM code, one command per line.
+        """
+        for line in vm_code.splitlines():
+            command = line.split("//")[0].strip()
+            if command.startswith("function "):
+                self.end_subroutine()
+            if command:
+                self.instructions.append(command)
+        self.end_subroutine()
+
+    def write_bootstrap(self, entry: str = "Sys.init") -> None:
+        """Writes the code that sets up the stack and calls the entry point
+        of the program, which must come first in the program.
+
+        Args:
+            entry (str): the function to call, Sys.init for programs linked
+            with the OS.
+        """
+        self.end_subroutine()
+        self.function = "$$BOOT"
+        self._queue([f"@{STACK_BASE}", "D=A", "@SP", "M=D"]
+                    + self._call(entry, 0)
+                    + ["($$BOOT$HALT)", "@$$BOOT$HALT", "0;JMP"])
+
+    def write_runtime(self) -> None:
+        """Writes the routines every call, return and shiftright of the
+        program jumps to.
+        """
+        self.end_subroutine()
+        lines = [f"({CALL_ROUTINE})"]  # D: return address, R13: function,
+        lines += PUSH_D                 # R14: number of arguments
+        for pointer in ("LCL", "ARG", "THIS", "THAT"):
+            lines += [f"@{pointer}", "D=M"] + PUSH_D
+        lines += ["@R14", "D=M", "@5", "D=D+A", "@SP", "D=M-D", "@ARG",
+                  "M=D", "@SP", "D=M", "@LCL", "M=D", "@R13", "A=M", "0;JMP"]
+        lines += [f"({RETURN_ROUTINE})",
+                  "@5", "D=A", "@LCL", "A=M-D", "D=M", "@R14", "M=D"]
+        lines += POP_D + ["@ARG", "A=M", "M=D", "@ARG", "D=M+1", "@SP", "M=D"]
+        for pointer in ("THAT", "THIS", "ARG", "LCL"):
+            lines += ["@LCL", "AM=M-1", "D=M", f"@{pointer}", "M=D"]
+        lines += ["@R14", "A=M", "0;JMP"]
+        # Arithmetic shift right, one bit at a time. D: return address.
+        lines += [f"({SHIFTRIGHT_ROUTINE})", "@R15", "M=D",
+                  "@SP", "A=M-1", "D=M", "@R13", "M=D", "@R14", "M=0"]
+        for bit in range(1, 15):
+            skip = f"{SHIFTRIGHT_ROUTINE}.{bit}"
+            lines += [f"@{1 << bit}", "D=A", "@R13", "D=D&M", f"@{skip}",
+                      "D;JEQ", f"@{1 << (bit - 1)}", "D=A", "@R14", "M=D|M",
+                      f"({skip})"]
+        skip = f"{SHIFTRIGHT_ROUTINE}.15"
+        lines += ["@R13", "D=M", f"@{skip}", "D;JGE",  # the sign bit stays
+                  "@16384", "D=A", "@R14", "M=D|M",
+                  "@32767", "D=!A", "@R14", "M=D|M", f"({skip})",
+                  "@R14", "D=M", "@SP", "A=M-1", "M=D",
+                  "@R15", "A=M", "0;JMP"]
+        self._queue(lines)
+
+    # Translation
+
+    def translate(self, instructions: typing.List[str]) -> typing.List[str]:
+        """
+        Args:
+            instructions (typing.List[str]): VM commands, one per item.
+
+        Returns:
+            typing.List[str]: the Hack assembly of the commands.
+        """
+        words = [instruction.split() for instruction in instructions]
+        lines = []
+        position = 0
+        while position < len(words):
+            taken = self._translate_fused(words, position, lines)
+            if not taken:
+                self._translate_command(words[position], lines)
+                taken = 1
+            position += taken
+        return lines
+
+    def _translate_fused(self, words, position: int,
+                         lines: typing.List[str]) -> int:
+        """Translates a sequence of commands starting at position together,
+        if it matches one of the fused forms.
+
+        Returns:
+            int: the number of commands translated, 0 if none.
+        """
+        command = words[position]
+        following = [word[0] for word in words[position + 1:position + 4]]
+        if command[0] in JUMPS:
+            jump = self._branch_jump(command[0], words, position + 1)
+            if jump is not None:
+                jump_to, taken = jump
+                lines += POP_D + ["@SP", "AM=M-1", "D=M-D"] + jump_to
+                return taken + 1
+            return 0
+        if command[0] != "push" or not following:
+            return 0
+        load = self._load(command[1], int(command[2]))
+        if following[0] == "pop":
+            target = words[position + 1]
+            lines += load + self._store(target[1], int(target[2]))
+            return 2
+        if following[0] in BINARY_OPERATIONS:
+            lines += load + ["@SP", "A=M-1",
+                             f"M={BINARY_OPERATIONS[following[0]]}"]
+            return 2
+        if following[0] == "if-goto":
+            lines += load + [self._label(words[position + 1][1]), "D;JNE"]
+            return 2
+        if following[0] in JUMPS:
+            jump = self._branch_jump(following[0], words, position + 2)
+            if jump is not None:
+                jump_to, taken = jump
+                lines += load + ["@SP", "AM=M-1", "D=M-D"] + jump_to
+                return taken + 2
+        return 0
+
+    def _branch_jump(self, comparison: str, words, position: int):
+        """Matches the if-goto, or not and if-goto, after a comparison.
+
+        Returns:
+            The lines that jump on D = x - y and the number of commands
+            matched, or None if no jump follows.
+        """
+        next_words = words[position:position + 2]
+        if next_words and next_words[0][0] == "if-goto":
+            return [self._label(next_words[0][1]),
+                    f"D;{JUMPS[comparison]}"], 1
+        if len(next_words) == 2 and next_words[0] == ["not"] and \
+                next_words[1][0] == "if-goto":
+            return [self._label(next_words[1][1]),
+                    f"D;{INVERTED_JUMPS[comparison]}"], 2
+        return None
+
+    def _translate_command(self, command: typing.List[str],
+                           lines: typing.List[str]) -> None:
+        name = command[0]
+        if name == "push":
+            lines += self._load(command[1], int(command[2])) + PUSH_D
+        elif name == "pop":
+            lines += POP_D + self._store(command[1], int(command[2]))
+        elif name in BINARY_OPERATIONS:
+            lines += POP_D + ["A=A-1", f"M={BINARY_OPERATIONS[name]}"]
+        elif name in UNARY_OPERATIONS:
+            lines += ["@SP", "A=M-1", f"M={UNARY_OPERATIONS[name]}"]
+        elif name == "shiftleft":
+            lines += ["@SP", "A=M-1", "D=M", "M=D+M"]
+        elif name == "shiftright":
+            back = self._unique_label("sr")
+            lines += [f"@{back}", "D=A", f"@{SHIFTRIGHT_ROUTINE}", "0;JMP",
+                      f"({back})"]
+        elif name in JUMPS:
+            done = self._unique_label("cmp")
+            lines += POP_D + ["A=A-1", "D=M-D", "M=-1", f"@{done}",
+                              f"D;{JUMPS[name]}", "@SP", "A=M-1", "M=0",
+                              f"({done})"]
+        elif name == "label":
+            lines.append(f"({self._label(command[1])[1:]})")
+        elif name == "goto":
+            lines += [self._label(command[1]), "0;JMP"]
+        elif name == "if-goto":
+            lines += POP_D + [self._label(command[1]), "D;JNE"]
+        elif name == "function":
+            self.function = command[1]
+            self.class_name = self.function.split(".")[0]
+            self.label_counter = 0
+            lines.append(f"({self.function})")
+            n_locals = int(command[2])
+            if n_locals:
+                lines += ["@SP", "A=M"] + ["M=0", "A=A+1"] * n_locals + \
+                    ["D=A", "@SP", "M=D"]
+        elif name == "call":
+            lines += self._call(command[1], int(command[2]))
+        elif name == "return":
+            lines += [f"@{RETURN_ROUTINE}", "0;JMP"]
+        else:
+            raise ValueError(f"Unknown VM command {' '.join(command)!r}")
+
+    def _call(self, function: str, n_args: int) -> typing.List[str]:
+        back = self._unique_label("ret")
+        return [f"@{function}", "D=A", "@R13", "M=D", f"@{n_args}", "D=A",
+                "@R14", "M=D", f"@{back}", "D=A", f"@{CALL_ROUTINE}",
+                "0;JMP", f"({back})"]
+
+    def _label(self, label: str) -> str:
+        # VM labels are local to their function.
+        return f"@{self.function}${label}"
+
+    def _unique_label(self, kind: str) -> str:
+        self.label_counter += 1
+        return f"{self.function}${kind}.{self.label_counter}"
+
+    def _address(self, segment: str,
+                 index: int) -> typing.Optional[typing.List[str]]:
+        """
+        Returns:
+            typing.Optional[typing.List[str]]: lines that leave the address
+            of a variable in A without changing D, or None if that takes
+            more lines than computing it in D.
+        """
+        if segment in SEGMENT_POINTERS:
+            if index > MAX_INCREMENTS:
+                return None
+            lines = [f"@{SEGMENT_POINTERS[segment]}", "A=M"]
+            if index:
+                lines[-1] = "A=M+1"
+                lines += ["A=A+1"] * (index - 1)
+            return lines
+        if segment == "static":
+            return [f"@{self.class_name}.{index}"]
+        if segment == "temp":
+            return [f"@R{5 + index}"]
+        if segment == "pointer":
+            return ["@THAT" if index else "@THIS"]
+        raise ValueError(f"Unknown segment {segment!r}")
+
+    def _load(self, segment: str, index: int) -> typing.List[str]:
+        """
+        Returns:
+            typing.List[str]: lines that load a value into D.
+        """
+        if segment == "constant":
+            return ["D=0"] if index == 0 else ["D=1"] if index == 1 \
+                else [f"@{index}", "D=A"]
+        address = self._address(segment, index)
+        if address is None:
+            return [f"@{index}", "D=A", f"@{SEGMENT_POINTERS[segment]}",
+                    "A=D+M", "D=M"]
+        return address + ["D=M"]
+
+    def _store(self, segment: str, index: int) -> typing.List[str]:
+        """
+        Returns:
+            typing.List[str]: lines that store D into a variable.
+        """
+        address = self._address(segment, index)
+        if address is not None:
+            return address + ["M=D"]
+        return ["@R13", "M=D", f"@{index}", "D=A",
+                f"@{SEGMENT_POINTERS[segment]}", "D=D+M", "@R14", "M=D",
+                "@R13", "D=M", "@R14", "A=M", "M=D"]
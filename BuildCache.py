@@ -0,0 +1,153 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import hashlib
+import json
+import os
+import time
+import typing
+
+# Name of the cache directory created next to the compiled sources.
+CACHE_DIRECTORY = ".jackcache"
+# Entries are evicted once they were not used for this many seconds, or,
+# least recently used first, while the cache is larger than this many bytes.
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class BuildCache:
+    """An on-disk cache of compiled classes, used to skip recompiling files
+    that did not change since the last build.
+
+    The cache is a directory holding one .vm file per entry and a manifest
+    that maps every entry's key to its file, size and last use time. The key
+    of a source is a hash of its content and of the compiler version (and
+    of anything else that changes the generated code), so an entry is never
+    used for a different source or for the output of another compiler.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE,
+                 max_age: float = DEFAULT_MAX_AGE) -> None:
+        """Opens the cache in the given directory, creating it if needed.
+
+        Args:
+            directory (str): the directory holding the cache.
+            max_size (int): the largest total size of the entries, in bytes.
+            max_age (float): the longest time an entry is kept unused, in
+            seconds.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.entries = {}
+        try:
+            with open(self.manifest_path, 'r') as manifest_file:
+                self.entries = json.load(manifest_file)["entries"]
+        except (OSError, ValueError, KeyError):
+            pass  # a missing or corrupt manifest is just an empty cache
+
+    @staticmethod
+    def key(source: bytes, salt: str) -> str:
+        """
+        Args:
+            source (bytes): the content of a source file.
+            salt (str): the compiler version and anything else the generated
+            code depends on.
+
+        Returns:
+            str: the cache key of the source.
+        """
+        digest = hashlib.sha256(salt.encode())
+        digest.update(b"\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_key(path: str, salt: str) -> str:
+        """Like key(), but hashes a source file on disk block by block.
+
+        Args:
+            path (str): the path of the source file.
+            salt (str): the compiler version and anything else the generated
+            code depends on.
+
+        Returns:
+            str: the cache key of the source.
+        """
+        digest = hashlib.sha256(salt.encode())
+        digest.update(b"\0")
+        with open(path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".vm")
+
+    def get(self, key: str) -> typing.Optional[str]:
+        """
+        Args:
+            key (str): the key of a source file.
+
+        Returns:
+            typing.Optional[str]: the cached VM code of the source, or None
+            if it is not in the cache.
+        """
+        if key not in self.entries:
+            return None
+        try:
+            with open(self._path(key), 'r') as cached_file:
+                vm_code = cached_file.read()
+        except OSError:
+            del self.entries[key]
+            return None
+        self.entries[key]["used"] = time.time()
+        return vm_code
+
+    def put(self, key: str, vm_code: str) -> None:
+        """Stores the VM code compiled from a source file.
+
+        Args:
+            key (str): the key of the source file.
+            vm_code (str): the VM code compiled from it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self._path(key) + ".tmp"
+        with open(temporary_path, 'w') as cached_file:
+            cached_file.write(vm_code)
+        os.replace(temporary_path, self._path(key))
+        self.entries[key] = {"size": len(vm_code), "used": time.time()}
+
+    def evict(self) -> None:
+        """Drops the entries that were not used for too long, then the least
+        recently used entries until the cache fits in its size limit.
+        """
+        oldest_allowed = time.time() - self.max_age
+        by_age = sorted(self.entries, key=lambda key: self.entries[key]["used"])
+        total_size = sum(entry["size"] for entry in self.entries.values())
+        for key in by_age:
+            entry = self.entries[key]
+            if entry["used"] >= oldest_allowed and total_size <= self.max_size:
+                break
+            total_size -= entry["size"]
+            del self.entries[key]
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def save(self) -> None:
+        """Evicts stale entries and writes the manifest back to disk."""
+        if not self.entries and not os.path.isdir(self.directory):
+            return
+        self.evict()
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({"entries": self.entries}, manifest_file)
+        os.replace(temporary_path, self.manifest_path)
@@ -0,0 +1,269 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import json
+import os
+import time
+import typing
+from BuildCache import BuildCache, DEFAULT_MAX_AGE
+from JackAST import ClassNode
+from JackTokenizer import tokenize, TokenBuffer, SYMBOL
+from SymbolTable import SymbolTable
+from TreeShaker import split_functions
+
+# Name of the index file, kept in the build cache directory.
+INDEX_FILE = "index.json"
+# Part of the index keys, bump it whenever signatures change shape.
+INDEX_VERSION = "signatures-1"
+SUBROUTINE_KINDS = ("constructor", "function", "method")
+
+
+def signature_of(tree: ClassNode, symbol_table: SymbolTable) -> dict:
+    """
+    Args:
+        tree (ClassNode): the syntax tree of a parsed class.
+        symbol_table (SymbolTable): the symbol table it was parsed with.
+
+    Returns:
+        dict: the signature of the class, in the form of extract_signature.
+    """
+    variables = sorted(symbol_table.class_table.items(),
+                       key=lambda item: item[1]["index"])
+    signature = {
+        "name": tree.name,
+        "fields": [[entry["type"], name] for name, entry in variables
+                   if entry["kind"] == "this"],
+        "statics": [[entry["type"], name] for name, entry in variables
+                    if entry["kind"] == "static"],
+        "subroutines": {}}
+    for subroutine in tree.subroutines:
+        arguments = sorted(
+            (entry["index"], entry["type"], name)
+            for name, entry in subroutine.symbols.items()
+            if entry["kind"] == "argument")
+        if subroutine.kind == "method":
+            arguments = arguments[1:]  # this
+        signature["subroutines"][subroutine.name] = {
+            "kind": subroutine.kind, "type": subroutine.return_type,
+            "parameters": [[argument_type, name]
+                           for _, argument_type, name in arguments]}
+    return signature
+
+
+def extract_signature(tokens: TokenBuffer) -> dict:
+    """Reads the interface of a class: its fields, statics and the
+    signatures of its subroutines. Subroutine bodies are skipped by matching
+    braces, without being parsed. For classes that are not compiled, the
+    compiler takes the signature of the others from their syntax tree.
+
+    Args:
+        tokens (TokenBuffer): the tokens of a class.
+
+    Returns:
+        dict: the signature of the class, with its "name", its "fields" and
+        "statics" as [type, name] pairs, and its "subroutines", mapping every
+        name to its "kind", return "type" and "parameters" as [type, name]
+        pairs.
+    """
+    values, types = tokens.values, tokens.types
+    try:
+        if values[0] != "class":
+            raise ValueError("Expected a class")
+        signature = {"name": values[1], "fields": [], "statics": [],
+                     "subroutines": {}}
+        position = 3  # past "class Name {"
+        while values[position] in ("static", "field"):
+            variables = signature["fields" if values[position] == "field"
+                                  else "statics"]
+            variable_type = values[position + 1]
+            position += 2
+            while True:
+                variables.append([variable_type, values[position]])
+                position += 2  # past the name and the "," or ";"
+                if values[position - 1] == ";":
+                    break
+        while values[position] in SUBROUTINE_KINDS:
+            kind, return_type, name = values[position:position + 3]
+            position += 4  # past "kind type name ("
+            parameters = []
+            while values[position] != ")":
+                parameters.append([values[position], values[position + 1]])
+                position += 2
+                if values[position] == ",":
+                    position += 1
+            position += 1
+            depth = 0
+            while True:
+                if types[position] == SYMBOL:
+                    if values[position] == "{":
+                        depth += 1
+                    elif values[position] == "}":
+                        depth -= 1
+                position += 1
+                if depth == 0:
+                    break
+            signature["subroutines"][name] = {
+                "kind": kind, "type": return_type, "parameters": parameters}
+    except IndexError:
+        raise ValueError("Unexpected end of input")
+    return signature
+
+
+def arity(subroutine: dict) -> int:
+    """
+    Args:
+        subroutine (dict): the signature of a subroutine.
+
+    Returns:
+        int: the number of arguments a call to it passes in VM code, which
+        includes the object of a method.
+    """
+    return len(subroutine["parameters"]) + \
+        (1 if subroutine["kind"] == "method" else 0)
+
+
+def check_calls(vm_codes: typing.Dict[str, str],
+                signatures: typing.Dict[str, dict]) -> typing.List[tuple]:
+    """Checks every call to a class of the program against the signature of
+    its callee. Calls to other classes, such as those of the OS, are not
+    checked.
+
+    Args:
+        vm_codes (typing.Dict[str, str]): the VM code of every class, keyed
+            by any name (such as the input path).
+        signatures (typing.Dict[str, dict]): the signatures of the classes
+            of the program, keyed by class name.
+
+    Returns:
+        typing.List[tuple]: (key, message) for every bad call.
+    """
+    problems = []
+    for key, vm_code in vm_codes.items():
+        for caller, function_code in split_functions(vm_code):
+            for line in function_code.splitlines():
+                if not line.startswith("call "):
+                    continue
+                _, callee, n_args = line.split()
+                class_name, _, name = callee.partition(".")
+                if class_name not in signatures:
+                    continue
+                subroutine = signatures[class_name]["subroutines"].get(name)
+                if subroutine is None:
+                    problems.append((key, f"{caller} calls {callee}, which "
+                                          f"does not exist"))
+                elif int(n_args) != arity(subroutine):
+                    expected = len(subroutine["parameters"])
+                    passed = int(n_args) - (arity(subroutine) - expected)
+                    problems.append((
+                        key, f"{caller} calls the {subroutine['kind']} "
+                             f"{callee} with {passed} arguments, it takes "
+                             f"{expected}"))
+    return problems
+
+
+class ClassIndex:
+    """A persistent index of class signatures, so builds can learn the
+    interface of every class of a program without parsing unchanged files
+    again. Entries are keyed by a hash of the source, like those of the
+    build cache, and are dropped once they were not used for a while.
+
+    Compiled classes add their signature with add(). Only the classes that
+    are neither compiled nor indexed are read by the index itself.
+    """
+
+    def __init__(self, directory: typing.Optional[str],
+                 max_age: float = DEFAULT_MAX_AGE,
+                 max_scan_size: typing.Optional[int] = None) -> None:
+        """Opens the index in the given directory.
+
+        Args:
+            directory (typing.Optional[str]): the directory holding the index
+            file, or None for an index that only lives in memory.
+            max_age (float): the longest time an entry is kept unused, in
+            seconds.
+            max_scan_size (typing.Optional[int]): the size in bytes of the
+            largest file the index reads itself, no limit if None.
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.max_scan_size = max_scan_size
+        self.entries = {}
+        self.changed = False
+        if directory is not None:
+            try:
+                with open(os.path.join(directory, INDEX_FILE), 'r') \
+                        as index_file:
+                    self.entries = json.load(index_file)["entries"]
+            except (OSError, ValueError, KeyError):
+                pass  # a missing or corrupt index is just an empty one
+
+    def add(self, path: str, signature: dict) -> None:
+        """Records the signature of a class that was compiled.
+
+        Args:
+            path (str): the path of its .jack file.
+            signature (dict): the signature of the class.
+        """
+        key = BuildCache.file_key(path, INDEX_VERSION)
+        self.entries[key] = {"signature": signature, "used": time.time()}
+        self.changed = True
+
+    def signature(self, path: str) -> dict:
+        """
+        Args:
+            path (str): the path of a .jack file.
+
+        Returns:
+            dict: the signature of its class, see extract_signature.
+        """
+        key = BuildCache.file_key(path, INDEX_VERSION)
+        entry = self.entries.get(key)
+        if entry is None:
+            if self.max_scan_size is not None and \
+                    os.path.getsize(path) > self.max_scan_size:
+                raise ValueError("Too large to read its signature")
+            with open(path, 'r') as source_file:
+                signature = extract_signature(tokenize(source_file.read()))
+            entry = self.entries[key] = {"signature": signature}
+        entry["used"] = time.time()
+        self.changed = True
+        return entry["signature"]
+
+    def signatures(self, paths: typing.List[str]) -> typing.Dict[str, dict]:
+        """
+        Args:
+            paths (typing.List[str]): the paths of .jack files.
+
+        Returns:
+            typing.Dict[str, dict]: the signature of every file whose class
+            could be read, keyed by path. Files that are broken beyond that
+            are left out, their compilation reports the error, and so are
+            files larger than max_scan_size that were not added.
+        """
+        signatures = {}
+        for path in paths:
+            try:
+                signatures[path] = self.signature(path)
+            except (OSError, ValueError):
+                continue
+        return signatures
+
+    def save(self) -> None:
+        """Drops the entries that were not used for too long, and writes the
+        index back to disk.
+        """
+        if self.directory is None or not self.changed:
+            return
+        oldest_allowed = time.time() - self.max_age
+        self.entries = {key: entry for key, entry in self.entries.items()
+                        if entry["used"] >= oldest_allowed}
+        os.makedirs(self.directory, exist_ok=True)
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path + ".tmp", 'w') as index_file:
+            json.dump({"entries": self.entries}, index_file)
+        os.replace(index_path + ".tmp", index_path)
+        self.changed = False
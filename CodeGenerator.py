@@ -0,0 +1,614 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from CompilerOptions import CompilerOptions
+from ConstantFolding import TRUE, FALSE, constant_value
+from JackAST import iter_children, NodeVisitor, ClassNode, SubroutineNode, \
+    Let, If, While, Do, Return, IntConst, StringConst, KeywordConst, \
+    Variable, ArrayAccess, Call, BinaryOp, UnaryOp
+from SymbolTable import SymbolTable
+from VMWriter import VMWriter
+
+# The longest command sequence a multiplication by a constant is replaced
+# with, longer ones still call Math.multiply.
+MAX_STRENGTH_REDUCTION = 24
+UNARY_COMMANDS = {"-": "neg", "~": "not", "^": "shiftleft", "#": "shiftright"}
+COMPARISONS = ("<", ">", "=")
+# Operators that never call a subroutine.
+PURE_OPERATORS = ("+", "-", "&", "|", "<", ">", "=", "~", "^", "#")
+# The segments of the variables a called subroutine cannot write.
+PRIVATE_SEGMENTS = ("local", "argument")
+
+
+def address_key(node):
+    """
+    Args:
+        node (Node): an array index expression.
+
+    Returns:
+        A hashable key that is equal for two expressions if they compute the
+        same value as long as no variable they use is written, or None if the
+        expression may call a subroutine or read an array.
+    """
+    if isinstance(node, Variable):
+        return node.segment, node.index
+    value = constant_value(node)
+    if value is not None:
+        return value
+    if isinstance(node, BinaryOp) and node.op in PURE_OPERATORS:
+        left, right = address_key(node.left), address_key(node.right)
+        if left is not None and right is not None:
+            return node.op, left, right
+    elif isinstance(node, UnaryOp) and node.op in PURE_OPERATORS:
+        operand = address_key(node.operand)
+        if operand is not None:
+            return node.op, operand
+    return None
+
+
+def variables_of(node) -> typing.Iterator[tuple]:
+    """
+    Yields:
+        tuple: the (segment, index) of every variable an expression reads.
+    """
+    if isinstance(node, Variable):
+        yield node.segment, node.index
+    for child in iter_children(node):
+        yield from variables_of(child)
+
+
+def is_boolean(node) -> bool:
+    """
+    Args:
+        node (Node): an expression node.
+
+    Returns:
+        bool: whether the expression is always 0 (false) or -1 (true), so
+        that "~" negates it logically.
+    """
+    if isinstance(node, BinaryOp):
+        return node.op in COMPARISONS or node.op in ("&", "|") and \
+            is_boolean(node.left) and is_boolean(node.right)
+    if isinstance(node, UnaryOp):
+        return node.op == "~" and is_boolean(node.operand)
+    if isinstance(node, KeywordConst):
+        return node.value in ("true", "false")
+    return constant_value(node) in (0, -1)
+
+
+def constant_comparison(node) -> typing.Optional[tuple]:
+    """
+    Args:
+        node (Node): an expression node.
+
+    Returns:
+        typing.Optional[tuple]: (op, x, c) if the expression compares an
+        expression x with a constant c by "<" or ">", with the constant moved
+        to the right (c > x is x < c), or None otherwise.
+    """
+    if not isinstance(node, BinaryOp) or node.op not in ("<", ">"):
+        return None
+    right = constant_value(node.right)
+    if right is not None:
+        return node.op, node.left, right
+    left = constant_value(node.left)
+    if left is not None:
+        return "<" if node.op == ">" else ">", node.right, left
+    return None
+
+
+class CodeGenerator(NodeVisitor):
+    """Walks the syntax tree of a class and emits its VM code through a
+    VMWriter.
+    """
+
+    def __init__(self, vm_writer: VMWriter, symbol_table: SymbolTable,
+                 options: CompilerOptions) -> None:
+        """Creates a new code generator.
+
+        Args:
+            vm_writer (VMWriter): writes the generated commands.
+            symbol_table (SymbolTable): the symbol table of the class, new
+            class variables (such as pooled strings) are defined in it.
+            options (CompilerOptions): the options to generate code with.
+        """
+        self.vm_writer = vm_writer
+        self.symbol_table = symbol_table
+        self.options = options
+        self.class_name = ""
+        self.n_fields = 0
+        self.if_counter = 0
+        self.while_counter = 0
+        self.string_counter = 0
+        # The element address pointer 1 holds, as a (base, index) pair of
+        # address keys, and the variables the address depends on. None when
+        # pointer 1 holds no known address.
+        self.that_address = None
+        self.that_variables = frozenset()
+
+    def visit_ClassNode(self, node: ClassNode) -> None:
+        self.class_name = node.name
+        self.n_fields = node.n_fields
+        for subroutine in node.subroutines:
+            self.visit(subroutine)
+
+    def visit_SubroutineNode(self, node: SubroutineNode) -> None:
+        self.if_counter = 0
+        self.while_counter = 0
+        self.string_counter = 0
+        self.forget_that()
+        self.vm_writer.write_function(f"{self.class_name}.{node.name}",
+                                      node.n_locals)
+        if node.kind == "constructor":
+            self.vm_writer.write_push("constant", self.n_fields)
+            self.write_call("Memory.alloc", 1)
+            self.vm_writer.write_pop("pointer", 0)
+        elif node.kind == "method":
+            self.vm_writer.write_push("argument", 0)
+            self.vm_writer.write_pop("pointer", 0)
+        self.generate_statements(node.body)
+
+    # Statements
+
+    def generate_statements(self, statements) -> None:
+        for statement in statements:
+            self.visit(statement)
+
+    def visit_Let(self, node: Let) -> None:
+        target = node.target
+        if node.index is None:
+            self.visit(node.value)
+            self.vm_writer.write_pop(target.segment, target.index)
+            if (target.segment, target.index) in self.that_variables:
+                self.forget_that()
+            return
+        instructions = self.vm_writer.instructions
+        saved = self.checkpoint()
+        # Point at the element first, if computing the value leaves pointer
+        # 1 alone.
+        offset = self.generate_address(target, node.index)
+        middle = len(instructions)
+        self.visit(node.value)
+        value_code = instructions[middle:]
+        if not any(command.startswith("call ") or command == "pop pointer 1"
+                   for command in value_code):
+            self.vm_writer.write_pop("that", offset)
+            return
+        self.rollback(saved)
+        # Otherwise compute the value first, if that cannot change the
+        # element's address.
+        if address_key(node.index) is not None and \
+                not any(command.startswith("call ") for command in value_code):
+            self.visit(node.value)
+            offset = self.generate_address(target, node.index)
+            self.vm_writer.write_pop("that", offset)
+            return
+        start = len(instructions)
+        address, offset = self.push_address(target, node.index)
+        self.visit(node.value)  # Compute value to store
+        self.vm_writer.write_pop("temp", 0)  # Store value temporarily
+        self.vm_writer.write_pop("pointer", 1)  # Set pointer 1 to the address
+        self.vm_writer.write_push("temp", 0)
+        self.vm_writer.write_pop("that", offset)  # Write value to address
+        self.remember_that(address, target, node.index, start)
+
+    def visit_If(self, node: If) -> None:
+        current_if = self.if_counter
+        self.if_counter += 1
+        if node.else_body is None:
+            if self.invertible(node.condition) or \
+                    is_boolean(node.condition):
+                self.generate_branch(node.condition, f"IF_FALSE{current_if}",
+                                     False)
+            else:  # "not" is bitwise, so any nonzero value must jump over
+                self.generate_branch(node.condition, f"IF_TRUE{current_if}",
+                                     True)
+                self.vm_writer.write_goto(f"IF_FALSE{current_if}")
+                self.write_label(f"IF_TRUE{current_if}")
+            self.generate_statements(node.then_body)
+            self.write_label(f"IF_FALSE{current_if}")
+            return
+        if self.invertible(node.condition):
+            label = f"IF_FALSE{current_if}"
+            self.generate_branch(node.condition, label, False)
+            first_body, second_body = node.then_body, node.else_body
+        else:  # jump to the then part rather than compute "not"
+            label = f"IF_TRUE{current_if}"
+            self.generate_branch(node.condition, label, True)
+            first_body, second_body = node.else_body, node.then_body
+        self.generate_statements(first_body)
+        if not first_body or not isinstance(first_body[-1], Return):
+            self.vm_writer.write_goto(f"IF_END{current_if}")
+        self.write_label(label)
+        self.generate_statements(second_body)
+        self.write_label(f"IF_END{current_if}")
+
+    def visit_While(self, node: While) -> None:
+        # The condition is tested at the bottom of the loop, so every
+        # iteration takes a single jump. A loop runs while its condition is
+        # true (-1), which "not; if-goto" exits on anything else, so other
+        # values must not repeat it.
+        current_while = self.while_counter
+        self.while_counter += 1
+        value = constant_value(node.condition)
+        if value is not None and value != TRUE:
+            return
+        condition = node.condition
+        if value is None and not is_boolean(condition):
+            condition = BinaryOp("=", condition, IntConst(TRUE))
+        if value is None:
+            self.vm_writer.write_goto(f"WHILE_EXP{current_while}")
+        self.write_label(f"WHILE_BODY{current_while}")
+        self.generate_statements(node.body)
+        if value is None:
+            self.write_label(f"WHILE_EXP{current_while}")
+        self.generate_branch(condition, f"WHILE_BODY{current_while}", True)
+
+    def visit_Do(self, node: Do) -> None:
+        self.visit(node.call)
+        self.vm_writer.write_pop("temp", 0)  # Discard the returned value
+
+    def visit_Return(self, node: Return) -> None:
+        if node.value is None:
+            self.vm_writer.write_push("constant", 0)
+        else:
+            self.visit(node.value)
+        self.vm_writer.write_return()
+
+    # Expressions
+
+    def visit_IntConst(self, node: IntConst) -> None:
+        self.vm_writer.write_constant(node.value)
+
+    def visit_StringConst(self, node: StringConst) -> None:
+        if self.options.string_pool:
+            self.generate_pooled_string(node.value)
+        else:
+            self.generate_string(node.value)
+
+    def visit_KeywordConst(self, node: KeywordConst) -> None:
+        if node.value == "true":
+            self.vm_writer.write_push("constant", 0)
+            self.vm_writer.write_arithmetic("not")
+        elif node.value == "this":
+            self.vm_writer.write_push("pointer", 0)
+        else:  # false, null
+            self.vm_writer.write_push("constant", 0)
+
+    def visit_Variable(self, node: Variable) -> None:
+        self.vm_writer.write_push(node.segment, node.index)
+
+    def visit_ArrayAccess(self, node: ArrayAccess) -> None:
+        offset = self.generate_address(node.array, node.index)
+        self.vm_writer.write_push("that", offset)
+
+    def visit_Call(self, node: Call) -> None:
+        n_args = len(node.arguments)
+        if node.receiver is not None:  # the object is the first argument
+            self.visit(node.receiver)
+            n_args += 1
+        for argument in node.arguments:
+            self.visit(argument)
+        self.write_call(node.name, n_args)
+
+    def visit_BinaryOp(self, node: BinaryOp) -> None:
+        if node.op in ("*", "/") and self.options.strength_reduction and \
+                self.generate_by_constant(node):
+            return
+        self.visit(node.left)
+        self.visit(node.right)
+        if node.op == "*":
+            self.write_call("Math.multiply", 2)
+        elif node.op == "/":
+            self.write_call("Math.divide", 2)
+        else:
+            self.vm_writer.write_arithmetic(node.op)
+
+    def visit_UnaryOp(self, node: UnaryOp) -> None:
+        self.visit(node.operand)
+        self.vm_writer.write_arithmetic(UNARY_COMMANDS[node.op])
+
+    # Helpers
+
+    def write_call(self, name: str, n_args: int) -> None:
+        """Writes a call, which may leave anything in pointer 1."""
+        self.vm_writer.write_call(name, n_args)
+        self.forget_that()
+
+    def write_label(self, label: str) -> None:
+        """Writes a label, where control may arrive from anywhere."""
+        self.vm_writer.write_label(label)
+        self.forget_that()
+
+    def checkpoint(self) -> tuple:
+        """
+        Returns:
+            tuple: the state of the generator, to undo everything written
+            after this point with rollback.
+        """
+        return len(self.vm_writer.instructions), self.that_address, \
+            self.that_variables, self.string_counter
+
+    def rollback(self, checkpoint: tuple) -> None:
+        """Drops the commands written since a checkpoint, and restores what
+        the generator knew at that point.
+
+        Args:
+            checkpoint (tuple): the state returned by checkpoint.
+        """
+        start, self.that_address, self.that_variables, \
+            self.string_counter = checkpoint
+        del self.vm_writer.instructions[start:]
+
+    def forget_that(self) -> None:
+        self.that_address = None
+        self.that_variables = frozenset()
+
+    def remember_that(self, address, array: Variable, index,
+                      start: int) -> None:
+        """Records that pointer 1 now holds an element address, which the
+        commands written since position start computed. Pointer 1 is
+        forgotten instead if the address cannot be tracked, or if a call
+        among those commands may have written a variable the address was
+        computed from: a callee can write any static or field, only the
+        locals and arguments of the caller are out of its reach.
+        """
+        variables = frozenset(variables_of(index)) | \
+            {(array.segment, array.index)}
+        if address is None or \
+                any(segment not in PRIVATE_SEGMENTS
+                    for segment, _ in variables) and \
+                any(command.startswith("call ")
+                    for command in self.vm_writer.instructions[start:]):
+            self.forget_that()
+            return
+        self.that_address = address
+        self.that_variables = variables
+
+    def push_address(self, array: Variable, index) -> tuple:
+        """Pushes the address of an array element. A constant index is not
+        added, but left as the offset in the that segment.
+
+        Returns:
+            tuple: the address as a (base, index) pair of address keys, or
+            None if the index cannot be tracked, and the offset.
+        """
+        base = (array.segment, array.index)
+        constant = constant_value(index)
+        if constant is not None and constant >= 0:
+            self.vm_writer.write_push(array.segment, array.index)
+            return (base, 0), constant
+        self.visit(index)
+        self.vm_writer.write_push(array.segment, array.index)
+        self.vm_writer.write_arithmetic("+")
+        index_key = address_key(index)
+        return (None if index_key is None else (base, index_key)), 0
+
+    def generate_address(self, array: Variable, index) -> int:
+        """Points pointer 1 at an array element, unless it already does.
+
+        Returns:
+            int: the offset of the element in the that segment.
+        """
+        constant = constant_value(index)
+        if constant is not None and constant >= 0:
+            address, offset = ((array.segment, array.index), 0), constant
+        else:
+            index_key = address_key(index)
+            address = None if index_key is None else \
+                ((array.segment, array.index), index_key)
+            offset = 0
+        if address is not None and address == self.that_address:
+            return offset
+        start = len(self.vm_writer.instructions)
+        address, offset = self.push_address(array, index)
+        self.vm_writer.write_pop("pointer", 1)
+        self.remember_that(address, array, index, start)
+        return offset
+
+    def generate_string(self, string_value: str) -> None:
+        """Builds a new String object holding a string constant."""
+        self.vm_writer.write_push("constant", len(string_value))
+        self.write_call("String.new", 1)
+        for char in string_value:
+            self.vm_writer.write_push("constant", ord(char))
+            self.write_call("String.appendChar", 2)
+
+    def generate_pooled_string(self, string_value: str) -> None:
+        """Pushes the pooled String object of a string constant. Every
+        distinct constant of the class gets a hidden static variable, and
+        the object is built the first time the constant is evaluated, when
+        the static still holds its initial 0.
+        """
+        pool_name = f'"{string_value}"'  # cannot clash with an identifier
+        if self.symbol_table.kind_of(pool_name) is None:
+            self.symbol_table.define(pool_name, "String", "static")
+        index = self.symbol_table.index_of(pool_name)
+        ready_label = f"STRING_READY{self.string_counter}"
+        self.string_counter += 1
+        self.vm_writer.write_push("static", index)
+        self.vm_writer.write_if(ready_label)
+        self.generate_string(string_value)
+        self.vm_writer.write_pop("static", index)
+        self.write_label(ready_label)
+        self.vm_writer.write_push("static", index)
+
+    def generate_branch(self, condition, label: str, jump_if: bool) -> None:
+        """Jumps to a label if a condition is true, or if it is false, and
+        falls through otherwise.
+
+        Args:
+            condition (Node): the condition expression.
+            label (str): the label to jump to.
+            jump_if (bool): the truth value of the condition to jump on.
+            Jumping on false computes "not", which is bitwise, unless the
+            condition is invertible, so it needs a boolean condition then.
+        """
+        value = constant_value(condition)
+        if value is not None:
+            if (value != FALSE) == jump_if:
+                self.vm_writer.write_goto(label)
+            return
+        if isinstance(condition, UnaryOp) and condition.op == "~" and \
+                is_boolean(condition.operand):
+            self.generate_branch(condition.operand, label, not jump_if)
+            return
+        if jump_if:
+            self.visit(condition)
+        elif not self.generate_inverted(condition):
+            self.visit(condition)
+            self.vm_writer.write_arithmetic("not")
+        self.vm_writer.write_if(label)
+
+    @staticmethod
+    def invertible(condition) -> bool:
+        """
+        Returns:
+            bool: whether generate_branch jumps on a false condition without
+            computing "not".
+        """
+        if constant_value(condition) is not None:
+            return True
+        if isinstance(condition, UnaryOp) and condition.op == "~" and \
+                is_boolean(condition.operand):
+            return True  # jumps when the operand is true
+        if not isinstance(condition, BinaryOp):
+            return False
+        if condition.op == "=":
+            return True
+        comparison = constant_comparison(condition)
+        if comparison is None:
+            return False
+        op, _, constant = comparison
+        # The complement compares with c - 1 or c + 1, which must not wrap.
+        return constant != (-32768 if op == "<" else 32767)
+
+    def generate_inverted(self, condition) -> bool:
+        """Computes a value that is true exactly when a comparison is false,
+        by choosing the complementary comparison: x = y is false when x - y
+        is not 0, and x < c is false when x > c - 1.
+
+        Returns:
+            bool: False if the condition cannot be inverted this way and
+            nothing was written, True otherwise.
+        """
+        if not self.invertible(condition) or \
+                not isinstance(condition, BinaryOp):
+            return False
+        left = constant_value(condition.left)
+        right = constant_value(condition.right)
+        if condition.op == "=":
+            if right == 0:
+                self.visit(condition.left)
+            elif left == 0:
+                self.visit(condition.right)
+            else:
+                self.visit(condition.left)
+                self.visit(condition.right)
+                self.vm_writer.write_arithmetic("-")
+            return True
+        op, variable, constant = constant_comparison(condition)
+        self.visit(variable)
+        if op == "<":  # x >= c is x > c - 1
+            self.vm_writer.write_constant(constant - 1)
+            self.vm_writer.write_arithmetic(">")
+        else:  # x <= c is x < c + 1
+            self.vm_writer.write_constant(constant + 1)
+            self.vm_writer.write_arithmetic("<")
+        return True
+
+    def generate_by_constant(self, node: BinaryOp) -> bool:
+        """Writes a multiplication or division by a constant as a shorter
+        sequence than a call to Math.multiply or Math.divide, if one exists.
+        A constant has no side effects, so a constant left operand of "*"
+        can be multiplied in after the right one was computed.
+
+        Returns:
+            bool: True if the operation was written, False if nothing was.
+        """
+        saved = self.checkpoint()
+        left = constant_value(node.left)
+        right = constant_value(node.right)
+        if right is not None:
+            self.visit(node.left)
+            if node.op == "*" and self.write_multiply_by_constant(right) or \
+                    node.op == "/" and self.write_divide_by_constant(right):
+                return True
+        elif left is not None and node.op == "*":
+            self.visit(node.right)
+            if self.write_multiply_by_constant(left):
+                return True
+        self.rollback(saved)
+        return False
+
+    def write_multiply_by_constant(self, constant: int) -> bool:
+        """Multiplies the value on top of the stack by a constant using shifts
+        and additions instead of calling Math.multiply. temp 1 holds the
+        multiplicand while the product is built.
+
+        Args:
+            constant (int): the constant to multiply by.
+
+        Returns:
+            bool: False if no short enough sequence exists and nothing was
+            written, True otherwise.
+        """
+        if constant < 0:
+            if constant == -32768 or \
+                    not self.write_multiply_by_constant(-constant):
+                return False
+            self.vm_writer.write_arithmetic("neg")
+            return True
+        if constant == 0:
+            self.vm_writer.write_push("constant", 0)
+            self.vm_writer.write_arithmetic("&")
+            return True
+        bits = bin(constant)[3:]  # the bits after the leading 1
+        ones = bits.count("1")
+        if len(bits) + 2 * ones + (2 if ones else 0) > MAX_STRENGTH_REDUCTION:
+            return False
+        if ones:
+            self.vm_writer.write_pop("temp", 1)
+            self.vm_writer.write_push("temp", 1)
+        for bit in bits:  # Horner's scheme, from the most significant bit
+            self.vm_writer.write_arithmetic("shiftleft")
+            if bit == "1":
+                self.vm_writer.write_push("temp", 1)
+                self.vm_writer.write_arithmetic("+")
+        return True
+
+    def write_divide_by_constant(self, constant: int) -> bool:
+        """Divides the value on top of the stack by a constant power of two
+        using shifts instead of calling Math.divide. Like Math.divide, the
+        quotient is truncated towards zero, so negative dividends are biased
+        by constant - 1 before shifting. temp 1 holds the dividend.
+
+        Args:
+            constant (int): the constant to divide by.
+
+        Returns:
+            bool: False if the constant is not a power of two and nothing was
+            written, True otherwise.
+        """
+        if constant == -1:
+            self.vm_writer.write_arithmetic("neg")
+            return True
+        if constant <= 0 or constant & (constant - 1):
+            return False
+        if constant > 1:
+            self.vm_writer.write_pop("temp", 1)
+            self.vm_writer.write_push("temp", 1)
+            self.vm_writer.write_push("temp", 1)
+            self.vm_writer.write_push("constant", 0)
+            self.vm_writer.write_arithmetic("<")
+            self.vm_writer.write_push("constant", constant - 1)
+            self.vm_writer.write_arithmetic("&")
+            self.vm_writer.write_arithmetic("+")
+            for _ in range(constant.bit_length() - 1):
+                self.vm_writer.write_arithmetic("shiftright")
+        return True
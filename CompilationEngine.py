@@ -1,4 +1,16 @@
-from JackTokenizer import JackTokenizer
+from JackTokenizer import JackTokenizer, StreamingJackTokenizer, KEYWORD, \
+    SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER
+from ClassIndex import signature_of
+from CodeGenerator import CodeGenerator
+from CompilerOptions import CompilerOptions
+from CompilerStats import optional_phase
+from ConstantFolding import ConstantFolder
+from JackAST import ClassNode, SubroutineNode, Let, If, While, Do, Return, \
+    IntConst, StringConst, KeywordConst, Variable, ArrayAccess, Call, \
+    BinaryOp, UnaryOp
+from LocalAllocator import LocalAllocator
+from LoopInvariantMover import LoopInvariantMover
+from PeepholeOptimizer import PeepholeOptimizer, thread_jumps
 from SymbolTable import SymbolTable
 from VMWriter import VMWriter
 
@@ -12,47 +24,110 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 
 
 class CompilationEngine:
-    """Gets input from a JackTokenizer and emits its parsed structure into an
-    output stream.
+    """Gets input from a JackTokenizer, parses it into a syntax tree and
+    emits the VM code of the tree into an output stream.
     """
 
-    def __init__(self, input_stream, output_stream) -> None:
+    def __init__(self, input_stream, output_stream, chunk_size=None,
+                 options=None, writer_class=VMWriter, stats=None) -> None:
         """
         Creates a new compilation engine with the given input and output. The
         next routine called must be compileClass()
         :param input_stream: The input stream.
         :param output_stream: The output stream.
+        :param chunk_size: If given, the input is tokenized lazily in chunks
+            of this many characters instead of being read whole.
+        :param options: The CompilerOptions to compile with.
+        :param writer_class: The backend, VMWriter or a class with its
+            interface such as AsmWriter.
+        :param stats: If given, a CompilerStats that collects the time of
+            every phase.
         """
-        self.while_counter = 0
-        self.tokenizer = JackTokenizer(input_stream)
+        self.options = options or CompilerOptions()
+        self.stats = stats
+        with self.phase("tokenize"):
+            if chunk_size:
+                self.tokenizer = StreamingJackTokenizer(
+                    input_stream, chunk_size)
+            else:
+                self.tokenizer = JackTokenizer(input_stream)
+        # The signature of the class, as kept by ClassIndex, once parsed.
+        self.signature = None
+        # The calls without a class or object, which call the class itself.
+        self.own_calls = []
         self.symbol_table = SymbolTable()
-        self.vm_writer = VMWriter(output_stream)
+        self.vm_writer = writer_class(output_stream)
+        self.vm_writer.passes.append(thread_jumps)
+        if self.options.optimize:
+            self.vm_writer.passes.append(PeepholeOptimizer().optimize)
+        if stats is not None:
+            self.vm_writer.passes = [stats.timed("passes", rewrite)
+                                     for rewrite in self.vm_writer.passes]
         self.output_stream = output_stream
         self.current_token = ""
         self.class_name = ""
-        self.if_counter = 0
 
-    def compile_class(self) -> None:
-        """Compiles a complete class."""
-        if self.tokenizer.has_more_tokens():
+    def compile_class(self):
+        """Compiles a complete class: parses it, folds its constants and
+        writes its VM code.
+
+        Returns:
+            The ClassNode of the class, or None if the input holds no class.
+        """
+        with self.phase("parse"):
+            tree = self.parse_class()
+        if tree is not None:
+            with self.phase("fold"):
+                tree = ConstantFolder().visit(tree)
+            with self.phase("codegen"):
+                CodeGenerator(self.vm_writer, self.symbol_table,
+                              self.options).visit(tree)
+        # Write whatever the VM writer still holds once the class is done.
+        with self.phase("write"):
+            self.vm_writer.flush()
+        return tree
+
+    def phase(self, name):
+        """Times a phase of the compilation when collecting statistics.
+
+        :param name: The name of the phase.
+        :return: A context manager, that does nothing without statistics.
+        """
+        return optional_phase(self.stats, name)
+
+    def parse_class(self):
+        """Parses a complete class into a ClassNode."""
+        if not self.tokenizer.has_more_tokens():
+            return None
+        self.tokenizer.advance()
+        self.current_token = self.tokenizer.current_token
+        if self.current_token != "class":
+            return None
+        self.tokenizer.advance()
+        self.current_token = self.tokenizer.current_token
+        self.class_name = self.current_token
+        subroutines = []
+        if self.tokenizer.current_type == IDENTIFIER:
             self.tokenizer.advance()
             self.current_token = self.tokenizer.current_token
-            if self.current_token == "class":
+            if self.current_token == "{":
                 self.tokenizer.advance()
+                while self.tokenizer.keyword() == "static" or self.tokenizer.keyword() == "field":
+                    self.compile_class_var_dec()
+                while self.tokenizer.keyword() == "constructor" or self.tokenizer.keyword() == "function" or self.tokenizer.keyword() == "method":
+                    subroutines.append(self.compile_subroutine())
                 self.current_token = self.tokenizer.current_token
-                self.class_name = self.current_token
-                if self.tokenizer.token_type() == 'IDENTIFIER':
-                    self.tokenizer.advance()
-                    self.current_token = self.tokenizer.current_token
-                    if self.current_token == "{":
-                        self.tokenizer.advance()
-                        while self.tokenizer.keyword() == "static" or self.tokenizer.keyword() == "field":
-                            self.compile_class_var_dec()
-                        while self.tokenizer.keyword() == "constructor" or self.tokenizer.keyword() == "function" or self.tokenizer.keyword() == "method":
-                            self.compile_subroutine()
-                        self.current_token = self.tokenizer.current_token
-                        if self.current_token == "}":
-                            return
+        tree = ClassNode(self.class_name, self.symbol_table.var_count("field"),
+                         subroutines)
+        self.signature = signature_of(tree, self.symbol_table)
+        # Only now are all subroutines known: functions and constructors of
+        # the class are called without an object.
+        for call in self.own_calls:
+            callee = self.signature["subroutines"].get(
+                call.name.partition(".")[2])
+            if callee is not None and callee["kind"] != "method":
+                call.receiver = None
+        return tree
 
     def compile_class_var_dec(self) -> None:  # Naomi
         """Compiles a static declaration or a field declaration."""
@@ -70,13 +145,12 @@ class CompilationEngine:
             self.tokenizer.advance() # Skip variable name
         self.tokenizer.advance() # Skip ';'
 
-    def compile_subroutine(self) -> None:
+    def compile_subroutine(self) -> SubroutineNode:
         """Compiles a complete method, function, or constructor."""
         self.symbol_table.start_subroutine()
-        self.if_counter = 0
-        self.while_counter = 0
         subroutine_type = self.tokenizer.keyword()
         self.tokenizer.advance() # Skip 'constructor', 'function', or 'method'
+        return_type = self.tokenizer.current_token
         self.tokenizer.advance() # Skip return type
         subroutine_name = self.tokenizer.identifier()
         self.tokenizer.advance() # Skip subroutine name
@@ -88,16 +162,21 @@ class CompilationEngine:
         self.tokenizer.advance() # Skip '{'
         while self.tokenizer.keyword() == "var":
             self.compile_var_dec()
-        self.vm_writer.write_function(f"{self.class_name}.{subroutine_name}", self.symbol_table.var_count("var"))
-        if subroutine_type == "constructor":
-            self.vm_writer.write_push("constant", self.symbol_table.var_count("field"))
-            self.vm_writer.write_call("Memory.alloc", 1)
-            self.vm_writer.write_pop("pointer", 0)
-        elif subroutine_type == "method":
-            self.vm_writer.write_push("argument", 0)
-            self.vm_writer.write_pop("pointer", 0)
-        self.compile_statements()
+        body = self.compile_statements()
         self.tokenizer.advance() # Skip '}'
+        subroutine = SubroutineNode(subroutine_type, return_type,
+                                    subroutine_name, body, 0,
+                                    self.symbol_table.subroutine_table)
+        # Passes that add or move locals run while the scope is current.
+        if self.options.hoist_invariants:
+            with self.phase("licm"):
+                LoopInvariantMover(self.symbol_table).visit(subroutine)
+        if self.options.reuse_locals:
+            with self.phase("reuse-locals"):
+                self.symbol_table.remap(LocalAllocator().allocate(
+                    body, self.symbol_table.subroutine_table))
+        subroutine.n_locals = self.symbol_table.var_count("var")
+        return subroutine
 
     def compile_parameter_list(self) -> None:  # Naomi
         """Compiles a (possibly empty) parameter list."""
@@ -126,248 +205,183 @@ class CompilationEngine:
         if self.tokenizer.current_token == ";":
             self.tokenizer.advance() # Skip ';'
 
-    def compile_statements(self) -> None:
+    def compile_statements(self) -> list:
         """Compiles a sequence of statements."""
-        while self.tokenizer.token_type() == 'KEYWORD':
+        statements = []
+        while self.tokenizer.current_type == KEYWORD:
             if self.tokenizer.keyword() == "let":
-                self.compile_let()
+                statements.append(self.compile_let())
             elif self.tokenizer.keyword() == "if":
-                self.compile_if()
+                statements.append(self.compile_if())
             elif self.tokenizer.keyword() == "while":
-                self.compile_while()
+                statements.append(self.compile_while())
             elif self.tokenizer.keyword() == "do":
-                self.compile_do()
+                statements.append(self.compile_do())
             elif self.tokenizer.keyword() == "return":
-                self.compile_return()
+                statements.append(self.compile_return())
+            else:
+                break
+        return statements
 
-    def compile_do(self) -> None:  # Naomi
+    def compile_do(self) -> Do:  # Naomi
         """Compiles a do statement."""
         self.tokenizer.advance()
-        self.compile_expression()
-        self.vm_writer.write_pop("temp", 0)
+        call = self.compile_expression()
         self.tokenizer.advance() # Skip ';'
+        return Do(call)
 
-    def compile_let(self) -> None:
+    def compile_let(self) -> Let:
         """Compiles a let statement."""
         self.tokenizer.advance() # Skip 'let'
-        name = self.tokenizer.current_token
+        target = self.variable(self.tokenizer.current_token)
         self.tokenizer.advance() # Skip variable name
-
+        index = None
         if self.tokenizer.current_token == "[":  # Array assignment
             self.tokenizer.advance() # Skip '['
-            self.compile_expression()
-            self.vm_writer.write_push(self.symbol_table.kind_of(name), self.symbol_table.index_of(name))  # Push array base
-            self.vm_writer.write_arithmetic("+")  # Compute address (base + index)
+            index = self.compile_expression()
             self.tokenizer.advance() # Skip ']'
-            self.tokenizer.advance()  # Skip '='
-            self.compile_expression() # Compute value to store  
-            self.vm_writer.write_pop("temp", 0)  # Store value temporarily
-            self.vm_writer.write_pop("pointer", 1)  # Set pointer 1 to computed address
-            self.vm_writer.write_push("temp", 0)  # Push the value
-            self.vm_writer.write_pop("that", 0)  # Write value to address
-        elif self.tokenizer.current_token == "=":  # Variable assignment
-            self.tokenizer.advance()  # Skip '='
-            self.compile_expression() # Comute expression on the right
-            self.vm_writer.write_pop(self.symbol_table.kind_of(name), self.symbol_table.index_of(name))  # Store in variable
-
+        self.tokenizer.advance()  # Skip '='
+        value = self.compile_expression() # Compute expression on the right
         self.tokenizer.advance() # Skip ';'
+        return Let(target, index, value)
 
-    def compile_while(self) -> None:
+    def compile_while(self) -> While:
         """Compiles a while statement."""
-        current_while = self.while_counter
-        self.while_counter += 1
-        self.vm_writer.write_label(f"WHILE_EXP{current_while}")
-
-        # Skip the 'while' keyword and the '(' symbol
         self.tokenizer.advance()  # Skip 'while'
         self.tokenizer.advance()  # Skip '('
-
-        # Compile the condition expression
-        self.compile_expression()
-
-        # Write the VM code for the condition
-        self.vm_writer.write_arithmetic("not")
-        self.vm_writer.write_if(f"WHILE_END{current_while}")
-
+        condition = self.compile_expression()
         self.tokenizer.advance()  # Skip ')'
         self.tokenizer.advance()  # Skip '{'
-
-        # Compile the statements inside the while loop
-        self.compile_statements()
-
-        # Write the VM code to go back to the beginning of the loop
-        self.vm_writer.write_goto(f"WHILE_EXP{current_while}")
-
-        # Write the label for the end of the while loop
-        self.vm_writer.write_label(f"WHILE_END{current_while}")
-
+        body = self.compile_statements()
         self.tokenizer.advance()  # Skip '}'
+        return While(condition, body)
 
-    def compile_return(self) -> None:
+    def compile_return(self) -> Return:
         """Compiles a return statement."""
         self.tokenizer.advance()
+        value = None
         if self.tokenizer.current_token != ";":
-            self.compile_expression()
-        else:
-            self.vm_writer.write_push("constant", 0)
-        self.vm_writer.write_return()
+            value = self.compile_expression()
         self.tokenizer.advance() # Skip ';'
+        return Return(value)
 
-    def compile_if(self) -> None:
+    def compile_if(self) -> If:
         """Compiles an if statement, possibly with a trailing else clause."""
-        current_if = self.if_counter
-        self.if_counter += 1
         self.tokenizer.advance()  # Skip 'if'
         self.tokenizer.advance()  # Skip '('
-
-        # Compile the condition expression
-        self.compile_expression()
-        self.vm_writer.write_if(f"IF_TRUE{current_if}")
-        self.vm_writer.write_goto(f"IF_FALSE{current_if}")
-        self.vm_writer.write_label(f"IF_TRUE{current_if}")
-
+        condition = self.compile_expression()
         self.tokenizer.advance()  # Skip ')'
         self.tokenizer.advance()  # Skip '{'
-
-        # Compile the 'if' body
-        self.compile_statements()
-
-
+        then_body = self.compile_statements()
         self.tokenizer.advance()  # Skip '}'
-
-        # Compile the 'else' body if present
+        else_body = None
         if self.tokenizer.current_token == "else":
-            self.vm_writer.write_goto(f"IF_END{current_if}")
-            self.vm_writer.write_label(f"IF_FALSE{current_if}")
             self.tokenizer.advance()  # Skip 'else'
             self.tokenizer.advance()  # Skip '{'
-            self.compile_statements()
+            else_body = self.compile_statements()
             self.tokenizer.advance()  # Skip '}'
-            self.vm_writer.write_label(f"IF_END{current_if}")
-        else:
-            self.vm_writer.write_label(f"IF_FALSE{current_if}")
+        return If(condition, then_body, else_body)
 
-    def compile_term(self) -> None:
-        """Compiles a term and generates the corresponding VM code."""
-        token_type = self.tokenizer.token_type()
+    def compile_term(self):
+        """Compiles a term.
+
+        Returns:
+            The node of the term.
+        """
+        token_type = self.tokenizer.current_type
         token_value = self.tokenizer.current_token
-        if token_type == 'INT_CONST':
-            self.vm_writer.write_push('constant', self.tokenizer.int_val())
+        if token_type == INT_CONST:
+            value = self.tokenizer.int_val()
             self.tokenizer.advance()
-        elif token_type == 'STRING_CONST':
+            return IntConst(value)
+        elif token_type == STRING_CONST:
             string_value = self.tokenizer.string_val()
-            self.vm_writer.write_push('constant', len(string_value))
-            self.vm_writer.write_call('String.new', 1)
-            for char in string_value:
-                self.vm_writer.write_push('constant', ord(char))
-                self.vm_writer.write_call('String.appendChar', 2)
             self.tokenizer.advance()
-        elif token_type == 'KEYWORD':
-            if token_value == 'true':
-                self.vm_writer.write_push('constant', 0)
-                self.vm_writer.write_arithmetic('not')
-            elif token_value in ['false', 'null']:
-                self.vm_writer.write_push('constant', 0)
-            elif token_value == 'this':
-                self.vm_writer.write_push('pointer', 0)
+            return StringConst(string_value)
+        elif token_type == KEYWORD:
             self.tokenizer.advance()
-        elif token_type == 'IDENTIFIER':
+            return KeywordConst(token_value)
+        elif token_type == IDENTIFIER:
+            next_token = self.tokenizer.peek()
             self.tokenizer.advance() # Skip identifier
-            if self.tokenizer.symbol() == '[':
-                self.tokenizer.advance() 
-                self.compile_expression()
-                self.vm_writer.write_push(self.symbol_table.kind_of(token_value), self.symbol_table.index_of(token_value))
-                self.vm_writer.write_arithmetic('+')
-                self.vm_writer.write_pop('pointer', 1)
-                self.vm_writer.write_push('that', 0)
-                self.tokenizer.advance()
-
-            elif self.tokenizer.symbol() in ['(', '.']:
-                self.compile_subroutine_call(token_value)
-            else:
-                self.vm_writer.write_push(self.symbol_table.kind_of(token_value),
-                                          self.symbol_table.index_of(token_value))
-        elif self.tokenizer.token_type() == "SYMBOL" :
-            if self.tokenizer.symbol() == "(":
+            if next_token == '[':
+                self.tokenizer.advance() # Skip '['
+                index = self.compile_expression()
+                self.tokenizer.advance() # Skip ']'
+                return ArrayAccess(self.variable(token_value), index)
+            elif next_token in ['(', '.']:
+                return self.compile_subroutine_call(token_value)
+            return self.variable(token_value)
+        elif token_type == SYMBOL:
+            if token_value == "(":
                 self.tokenizer.advance()
-                self.compile_expression()
+                node = self.compile_expression()
                 self.tokenizer.advance() # Skip ')'
-            elif self.tokenizer.symbol() in ["~", "-", "^", "#"]:
+                return node
+            elif token_value in ["~", "-", "^", "#"]:
                 self.tokenizer.advance()
-                self.compile_term()
-                if token_value == "-":
-                    self.vm_writer.write_arithmetic("neg")
-                elif token_value == "~":
-                    self.vm_writer.write_arithmetic("not")
-                elif token_value == "^":
-                    self.vm_writer.write_arithmetic("shiftleft")
-                elif token_value == "#":
-                    self.vm_writer.write_arithmetic("shiftright")
+                return UnaryOp(token_value, self.compile_term())
+        raise ValueError(f"Unexpected token {token_value!r}")
+
+    def compile_expression(self):
+        """Compiles an expression. Jack has no operator precedence, so
+        operators are applied from left to right.
 
-    def compile_expression(self) -> None:
-        """Compiles an expression."""
-        self.compile_term()
+        Returns:
+            The node of the expression.
+        """
+        node = self.compile_term()
         while self.tokenizer.current_token in ["+", "-", "*", "/", "|", "=", "<", ">", "&"]:
             op = self.tokenizer.current_token
             self.tokenizer.advance()
-            self.compile_term()
-            if op == "*":
-                self.vm_writer.write_call("Math.multiply", 2)
-            elif op == "/":
-                self.vm_writer.write_call("Math.divide", 2)
-            else:
-                self.vm_writer.write_arithmetic(op)
+            node = BinaryOp(op, node, self.compile_term())
+        return node
 
-    def compile_expression_list(self) -> int:
+    def compile_expression_list(self) -> list:
         """Compiles a (possibly empty) comma-separated list of expressions."""
-        count = 0
-        if self.tokenizer.token_type() != 'SYMBOL' or self.tokenizer.symbol() != ")":  # not empty expression list
-            self.compile_expression()
-            count += 1
-            while self.tokenizer.token_type() == 'SYMBOL' and self.tokenizer.symbol() == ",":
+        expressions = []
+        if self.tokenizer.current_type != SYMBOL or self.tokenizer.symbol() != ")":  # not empty expression list
+            expressions.append(self.compile_expression())
+            while self.tokenizer.current_type == SYMBOL and self.tokenizer.symbol() == ",":
                 self.tokenizer.advance()
-                self.compile_expression()
-                count += 1
-        return count
+                expressions.append(self.compile_expression())
+        return expressions
 
-    def compile_type_and_var_name(self) -> None:
-        """Compiles type and variable name."""
-        if self.tokenizer.token_type() == 'KEYWORD':
-            self.output_stream.write(f"<keyword> {self.tokenizer.keyword()} </keyword>\n")
-        elif self.tokenizer.token_type() == 'IDENTIFIER':
-            self.output_stream.write(f"<identifier> {self.tokenizer.identifier()} </identifier>\n")
-        self.tokenizer.advance()
-        self.output_stream.write(f"<identifier> {self.tokenizer.identifier()} </identifier>\n")
-        self.tokenizer.advance()
-        while self.tokenizer.symbol() == ",":
-            self.output_stream.write(f"<symbol> {self.tokenizer.symbol()} </symbol>\n")
-            self.tokenizer.advance()
-            self.output_stream.write(f"<identifier> {self.tokenizer.identifier()} </identifier>\n")
-            self.tokenizer.advance()
-        self.output_stream.write(f"<symbol> {self.tokenizer.symbol()} </symbol>\n")
-        self.tokenizer.advance()
-
-    def compile_subroutine_call(self, subroutine_name):
-        """Compiles a subroutine call and generates the corresponding VM code."""
-        added_args = 0
+    def compile_subroutine_call(self, subroutine_name) -> Call:
+        """Compiles a subroutine call."""
+        receiver = None
         if self.tokenizer.symbol() == '.':
             self.tokenizer.advance() # Skip '.'
             class_or_var_name = subroutine_name
             subroutine_name = self.tokenizer.identifier()
             self.tokenizer.advance() # Skip subroutine name
             if self.symbol_table.kind_of(class_or_var_name):  # class_or_var_name is a variable
-                self.vm_writer.write_push(self.symbol_table.kind_of(class_or_var_name),
-                                          self.symbol_table.index_of(class_or_var_name))
-                added_args = 1
+                receiver = self.variable(class_or_var_name)
                 subroutine_name = f"{self.symbol_table.type_of(class_or_var_name)}.{subroutine_name}"
             else:  # class_or_var_name is a class
                 subroutine_name = f"{class_or_var_name}.{subroutine_name}"
         else:
-            self.vm_writer.write_push('pointer', 0)  # push this
-            added_args = 1  # this is the first argument
+            receiver = KeywordConst("this")  # this is the first argument
             subroutine_name = f"{self.class_name}.{subroutine_name}"
 
         self.tokenizer.advance() # Skip '('
-        n_args = self.compile_expression_list() + added_args
-        self.tokenizer.advance()
-        self.vm_writer.write_call(subroutine_name, n_args)
+        arguments = self.compile_expression_list()
+        self.tokenizer.advance() # Skip ')'
+        call = Call(subroutine_name, receiver, arguments)
+        if isinstance(receiver, KeywordConst):
+            self.own_calls.append(call)
+        return call
+
+    def variable(self, name: str) -> Variable:
+        """
+        Args:
+            name (str): the name of a variable in the current scope.
+
+        Returns:
+            Variable: the node of the variable, bound to its symbol table
+            entry.
+        """
+        symbol = self.symbol_table.lookup(name)
+        if symbol is None:
+            raise ValueError(f"Undefined variable {name!r} in {self.class_name}")
+        return Variable(name, symbol)
@@ -0,0 +1,244 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+A compile server: a long running process that compiles Jack files on
+request, so that builds skip starting Python and importing the compiler.
+Start it with "python CompileServer.py" and build with
+"JackCompiler <path> --server".
+
+Requests and responses are single lines of JSON over a Unix socket:
+
+    {"command": "compile", "paths": [...], "options": {...}}
+    -> {"results": [{"path": ..., "vm_code": ..., "signature": ...,
+                     "error": ...}, ...]}
+    {"command": "status"}   -> {"requests": ..., "files": ..., ...}
+    {"command": "shutdown"} -> {"stopping": true}
+"""
+import argparse
+import collections
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import typing
+from BuildCache import BuildCache
+from CompilerOptions import CompilerOptions
+from JackCompiler import compile_file, COMPILER_VERSION, SERVER_SOCKET
+
+# The number of compiled classes the server keeps in memory.
+DEFAULT_MAX_ENTRIES = 4096
+# How long the server waits for a client to send or take a line, in seconds.
+# Requests are served one at a time, so a stalled client must not hold it.
+CLIENT_TIMEOUT = 10.0
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers every line of JSON a client sends with a line of JSON."""
+
+    timeout = CLIENT_TIMEOUT
+
+    def handle(self) -> None:
+        try:
+            for line in self.rfile:
+                try:
+                    response = self.server.respond(json.loads(line))
+                except (ValueError, TypeError, KeyError) as error:
+                    response = {"error": f"bad request: {error}"}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+        except OSError:
+            pass  # the client stalled or left, serve the next one
+
+
+class CompileServer(socketserver.UnixStreamServer):
+    """Compiles files for clients, keeping the compiler loaded and the
+    classes it compiled in memory. A file is only read again when its
+    modification time or size changed, and only compiled again when its
+    content changed.
+
+    Requests are served one at a time, so the memory cache needs no locks.
+    """
+
+    def __init__(self, socket_path: str = SERVER_SOCKET,
+                 max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        """Starts listening on a socket.
+
+        Args:
+            socket_path (str): the path of the Unix socket to create.
+            max_entries (int): the largest number of compiled classes to
+            keep, the least recently used ones are dropped first.
+        """
+        self.max_entries = max_entries
+        # (path, salt) -> (modification time, size, key) of the last read.
+        self.files = {}
+        # key -> (VM code, signature), in the order of last use.
+        self.compiled = collections.OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.stopping = False
+        super().__init__(socket_path, _RequestHandler)
+
+    def serve_until_shutdown(self) -> None:
+        """Handles requests until a client asks the server to stop."""
+        while not self.stopping:
+            self.handle_request()
+
+    def respond(self, request: dict) -> dict:
+        """
+        Args:
+            request (dict): a request of a client.
+
+        Returns:
+            dict: the response to send back.
+        """
+        command = request.get("command", "compile")
+        if command == "shutdown":
+            self.stopping = True
+            return {"stopping": True}
+        if command == "status":
+            return {"requests": self.requests, "hits": self.hits,
+                    "files": len(self.files),
+                    "compiled": len(self.compiled),
+                    "version": COMPILER_VERSION}
+        if command != "compile":
+            return {"error": f"unknown command {command}"}
+        options = CompilerOptions(**request.get("options", {}))
+        results = []
+        for path in request["paths"]:
+            self.requests += 1
+            try:
+                vm_code, signature = self.compile(path, options)
+                results.append({"path": path, "vm_code": vm_code,
+                                "signature": signature, "error": None})
+            except Exception as error:
+                results.append({"path": path, "vm_code": None,
+                                "signature": None, "error": str(error)})
+        return {"results": results}
+
+    def compile(self, path: str, options: CompilerOptions) -> tuple:
+        """Compiles a file, or takes it from memory if it did not change.
+
+        Args:
+            path (str): the path of a .jack file.
+            options (CompilerOptions): the options to compile with.
+
+        Returns:
+            tuple: the VM code of the class and its signature, as kept by
+            ClassIndex (None if the file holds no class).
+        """
+        salt = f"{COMPILER_VERSION};{options.fingerprint()}"
+        status = os.stat(path)
+        known = self.files.get((path, salt))
+        if known is not None and known[:2] == (status.st_mtime_ns,
+                                              status.st_size) \
+                and known[2] in self.compiled:
+            return self._hit(known[2])
+        with open(path, 'rb') as input_file:
+            source = input_file.read()
+        key = BuildCache.key(source, salt)
+        self.files[(path, salt)] = (status.st_mtime_ns, status.st_size, key)
+        if key in self.compiled:
+            return self._hit(key)
+        output_file = io.StringIO()
+        engine = compile_file(io.StringIO(source.decode()), output_file,
+                              options=options)
+        self.compiled[key] = (output_file.getvalue(), engine.signature)
+        while len(self.compiled) > self.max_entries:
+            self.compiled.popitem(last=False)
+        return self.compiled[key]
+
+    def _hit(self, key: str) -> tuple:
+        self.hits += 1
+        self.compiled.move_to_end(key)
+        return self.compiled[key]
+
+
+def server_running(socket_path: str) -> bool:
+    """
+    Args:
+        socket_path (str): the path of a Unix socket.
+
+    Returns:
+        bool: True if a server accepts connections on the socket.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CLIENT_TIMEOUT)
+            connection.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def stop_server(socket_path: str) -> int:
+    """Asks the server listening on a socket to stop.
+
+    Args:
+        socket_path (str): the path of the Unix socket.
+
+    Returns:
+        int: the exit code, non-zero if no server was listening.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CLIENT_TIMEOUT)
+            connection.connect(socket_path)
+            connection.sendall(b'{"command": "shutdown"}\n')
+            connection.recv(64)
+    except OSError:
+        print(f"CompileServer: no server is listening on {socket_path}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Runs a compile server until a client stops it.
+
+    Args:
+        argv (typing.Optional[typing.List[str]]): the command line arguments,
+            sys.argv[1:] if None.
+
+    Returns:
+        int: the exit code, non-zero if another server is already running,
+        or with --stop, if none is.
+    """
+    parser = argparse.ArgumentParser(
+        prog="CompileServer", description="Compiles Jack files on request.")
+    parser.add_argument(
+        "--socket", default=SERVER_SOCKET, metavar="PATH",
+        help=f"the Unix socket to listen on (default: {SERVER_SOCKET})")
+    parser.add_argument(
+        "--stop", action="store_true",
+        help="stop the server listening on the socket instead")
+    parser.add_argument(
+        "--max-entries", type=int, default=DEFAULT_MAX_ENTRIES, metavar="N",
+        help="keep at most N compiled classes in memory")
+    args = parser.parse_args(argv)
+    if args.stop:
+        return stop_server(args.socket)
+    if server_running(args.socket):
+        print(f"CompileServer: a server is already listening on "
+              f"{args.socket}", file=sys.stderr)
+        return 1
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)  # left behind by a server that died
+    server = CompileServer(args.socket, args.max_entries)
+    try:
+        server.serve_until_shutdown()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+
+
+class CompilerOptions:
+    """The settings that change the code the compiler generates. A single
+    instance is handed to every CompilationEngine of a build.
+    """
+
+    def __init__(self, optimize: bool = False,
+                 strength_reduction: bool = True,
+                 string_pool: bool = False,
+                 reuse_locals: bool = False,
+                 hoist_invariants: bool = False) -> None:
+        """Creates a new set of options.
+
+        Args:
+            optimize (bool): run the peephole optimizer over the VM commands
+            of every subroutine.
+            strength_reduction (bool): replace multiplications and divisions
+            by constants with shiftleft/shiftright sequences. These commands
+            are not part of the standard VM language.
+            string_pool (bool): build every distinct string constant of a
+            class only once, in a hidden static variable, and reuse it. All
+            uses of a constant then share one String object, so the program
+            must not modify or dispose the strings of constants.
+            reuse_locals (bool): let locals whose values are never needed at
+            the same time share a slot, so subroutines declare fewer locals.
+            hoist_invariants (bool): compute the expressions of while loops
+            that do not change between iterations once, before the loop.
+        """
+        self.optimize = optimize
+        self.strength_reduction = strength_reduction
+        self.string_pool = string_pool
+        self.reuse_locals = reuse_locals
+        self.hoist_invariants = hoist_invariants
+
+    def fingerprint(self) -> str:
+        """
+        Returns:
+            str: a short text that differs whenever the options would make
+            the compiler generate different code, used in build cache keys.
+        """
+        return ",".join(f"{name}={value}"
+                        for name, value in sorted(vars(self).items()))
@@ -0,0 +1,180 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import collections
+import contextlib
+import json
+import time
+import typing
+from TreeShaker import split_functions
+
+# The number of largest subroutines reports list.
+LARGEST_SUBROUTINES = 10
+
+
+def optional_phase(stats: typing.Optional["CompilerStats"],
+                   name: str) -> typing.ContextManager:
+    """
+    Args:
+        stats (typing.Optional[CompilerStats]): statistics being collected,
+            or None.
+        name (str): the name of a phase.
+
+    Returns:
+        typing.ContextManager: times the code run inside a with statement as
+        the given phase, or does nothing if there are no statistics.
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.phase(name)
+
+
+class CompilerStats:
+    """Collects where a build spends its time and what it generates: the
+    wall time of every phase and of every file, the number of tokens, the
+    number of emitted VM commands by opcode and the largest subroutines.
+
+    Phases may nest, and the time of an inner phase is not counted in the
+    phase around it, so the times of all phases add up to the whole build.
+    Collecting is only done when a CompilerStats is handed to the compiler,
+    without one the compiler skips all measurements.
+    """
+
+    def __init__(self) -> None:
+        """Creates an empty set of statistics."""
+        self.phases = collections.defaultdict(float)
+        self.files = {}
+        self.opcodes = collections.Counter()
+        self.subroutines = []
+        self._inner = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> typing.Iterator[None]:
+        """Times the code run inside a with statement as the given phase.
+
+        Args:
+            name (str): the name of the phase, such as "parse".
+        """
+        self._inner.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] += elapsed - self._inner.pop()
+            if self._inner:
+                self._inner[-1] += elapsed
+
+    def timed(self, name: str, function: typing.Callable) -> typing.Callable:
+        """
+        Args:
+            name (str): the name of a phase.
+            function (typing.Callable): any function.
+
+        Returns:
+            typing.Callable: the function, with every call timed as the
+            given phase.
+        """
+        def timed_function(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return timed_function
+
+    def record_file(self, path: str, seconds: float, tokens: int,
+                    cached: bool = False) -> None:
+        """Records the compilation of a single file.
+
+        Args:
+            path (str): the path of the file.
+            seconds (float): the wall time its compilation took.
+            tokens (int): the number of its tokens.
+            cached (bool): whether it was taken from the build cache.
+        """
+        self.files[path] = {"seconds": seconds, "tokens": tokens,
+                            "cached": cached}
+
+    def count_code(self, vm_code: str) -> None:
+        """Counts the commands of generated VM code, by opcode and by
+        subroutine.
+
+        Args:
+            vm_code (str): the VM code of a class.
+        """
+        for name, function_code in split_functions(vm_code):
+            lines = function_code.splitlines()
+            self.opcodes.update(line.split(" ", 1)[0] for line in lines)
+            if name:
+                self.subroutines.append((len(lines) - 1, name))
+
+    def merge(self, other: "CompilerStats") -> None:
+        """Adds the statistics collected elsewhere, such as in a worker
+        process, to these.
+
+        Args:
+            other (CompilerStats): the statistics to add.
+        """
+        for name, seconds in other.phases.items():
+            self.phases[name] += seconds
+        self.files.update(other.files)
+        self.opcodes.update(other.opcodes)
+        self.subroutines.extend(other.subroutines)
+
+    def as_dict(self) -> dict:
+        """
+        Returns:
+            dict: the statistics, in a form json can write.
+        """
+        largest = sorted(self.subroutines, reverse=True)[:LARGEST_SUBROUTINES]
+        return {
+            "phases": dict(self.phases),
+            "files": self.files,
+            "tokens": sum(file["tokens"] for file in self.files.values()),
+            "commands": sum(self.opcodes.values()),
+            "opcodes": dict(self.opcodes.most_common()),
+            "largest_subroutines": [{"name": name, "commands": commands}
+                                    for commands, name in largest],
+        }
+
+    def to_json(self) -> str:
+        """
+        Returns:
+            str: the statistics as JSON.
+        """
+        return json.dumps(self.as_dict(), indent=1)
+
+    def format_table(self) -> str:
+        """
+        Returns:
+            str: the statistics as human-readable tables.
+        """
+        stats = self.as_dict()
+        total = sum(self.phases.values()) or 1.0
+        lines = [f"{'phase':<24}{'seconds':>10}{'share':>8}"]
+        for name, seconds in sorted(self.phases.items(),
+                                    key=lambda item: -item[1]):
+            lines.append(f"{name:<24}{seconds:>10.4f}"
+                         f"{seconds / total:>8.1%}")
+        lines.append("")
+        lines.append(f"{'file':<48}{'seconds':>10}{'tokens':>10}")
+        for path, file in sorted(self.files.items(),
+                                 key=lambda item: -item[1]["seconds"]):
+            seconds = "cached" if file["cached"] else \
+                f"{file['seconds']:.4f}"
+            lines.append(f"{path[-48:]:<48}{seconds:>10}"
+                         f"{file['tokens']:>10}")
+        lines.append(f"{'total':<48}{'':>10}{stats['tokens']:>10}")
+        lines.append("")
+        lines.append(f"{'opcode':<24}{'commands':>10}")
+        for opcode, count in stats["opcodes"].items():
+            lines.append(f"{opcode:<24}{count:>10}")
+        lines.append(f"{'total':<24}{stats['commands']:>10}")
+        lines.append("")
+        lines.append(f"{'largest subroutines':<48}{'commands':>10}")
+        for subroutine in stats["largest_subroutines"]:
+            lines.append(f"{subroutine['name']:<48}"
+                         f"{subroutine['commands']:>10}")
+        return "\n".join(lines)
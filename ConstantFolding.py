@@ -0,0 +1,122 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Evaluates Jack operators on constants at compile time, with the semantics
+of the Hack platform: 16-bit two's complement words, 0 for false and -1 for
+true. Division truncates towards zero like Math.divide, and shifts are
+arithmetic.
+"""
+import typing
+from JackAST import NodeTransformer, IntConst, KeywordConst, BinaryOp, \
+    UnaryOp
+
+TRUE = -1
+FALSE = 0
+
+
+def to_word(value: int) -> int:
+    """
+    Args:
+        value (int): any integer.
+
+    Returns:
+        int: the value wrapped to a signed 16-bit word.
+    """
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+def _divide(x: int, y: int) -> typing.Optional[int]:
+    if y == 0:
+        return None  # left for Math.divide to report at run time
+    quotient = abs(x) // abs(y)
+    return quotient if (x < 0) == (y < 0) else -quotient
+
+
+BINARY = {
+    "+": lambda x, y: x + y,
+    "-": lambda x, y: x - y,
+    "*": lambda x, y: x * y,
+    "/": _divide,
+    "&": lambda x, y: x & y,
+    "|": lambda x, y: x | y,
+    "<": lambda x, y: TRUE if x < y else FALSE,
+    ">": lambda x, y: TRUE if x > y else FALSE,
+    "=": lambda x, y: TRUE if x == y else FALSE,
+}
+
+UNARY = {
+    "-": lambda x: -x,
+    "~": lambda x: ~x,
+    "^": lambda x: x << 1,
+    "#": lambda x: x >> 1,
+}
+
+
+def fold_binary(op: str, x: int, y: int) -> typing.Optional[int]:
+    """
+    Args:
+        op (str): a binary Jack operator.
+        x (int): the constant left operand.
+        y (int): the constant right operand.
+
+    Returns:
+        typing.Optional[int]: the value of "x op y", or None if it cannot be
+        computed at compile time.
+    """
+    value = BINARY[op](x, y)
+    return None if value is None else to_word(value)
+
+
+def fold_unary(op: str, x: int) -> int:
+    """
+    Args:
+        op (str): a unary Jack operator.
+        x (int): the constant operand.
+
+    Returns:
+        int: the value of "op x".
+    """
+    return to_word(UNARY[op](x))
+
+
+def constant_value(node) -> typing.Optional[int]:
+    """
+    Args:
+        node (Node): an expression node.
+
+    Returns:
+        typing.Optional[int]: the value of the node if it is a constant,
+        None otherwise.
+    """
+    if isinstance(node, IntConst):
+        return node.value
+    if isinstance(node, KeywordConst) and node.value != "this":
+        return TRUE if node.value == "true" else FALSE
+    return None
+
+
+class ConstantFolder(NodeTransformer):
+    """Replaces every operator whose operands are constants by an IntConst
+    holding its value. Children are folded first, so whole constant
+    subexpressions collapse into a single constant.
+    """
+
+    def visit_BinaryOp(self, node: BinaryOp):
+        self.generic_visit(node)
+        left = constant_value(node.left)
+        right = constant_value(node.right)
+        if left is None or right is None:
+            return node
+        value = fold_binary(node.op, left, right)
+        return node if value is None else IntConst(value)
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        self.generic_visit(node)
+        operand = constant_value(node.operand)
+        if operand is None:
+            return node
+        return IntConst(fold_unary(node.op, operand))
@@ -0,0 +1,235 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Inlines small leaf subroutines across classes. An inlined body keeps its
+arguments and locals in temp 2-7, which generated code never uses, and a
+method's object is addressed through "that" instead of "this", so the
+caller's own this stays untouched. The compiler never keeps a value in a
+temp or in pointer 1 across a call, so the body may use them freely.
+"""
+import typing
+from TreeShaker import split_functions
+
+# Callees with more VM commands than this are not inlined by default.
+DEFAULT_INLINE_THRESHOLD = 8
+# The temp registers that hold the arguments and locals of inlined bodies.
+INLINE_TEMPS = range(2, 8)
+METHOD_PROLOGUE = ["push argument 0", "pop pointer 0"]
+
+
+class Callee:
+    """A subroutine that can be inlined, with its body ready to be copied."""
+
+    def __init__(self, name: str, min_args: int, n_locals: int,
+                 method: bool, body: typing.List[typing.List[str]]) -> None:
+        """
+        Args:
+            name (str): the full name of the subroutine.
+            min_args (int): the number of arguments it needs at least, one
+            past the highest argument it uses, including the object of a
+            method.
+            n_locals (int): the number of its locals.
+            method (bool): whether it is a method.
+            body (typing.List[typing.List[str]]): its commands after the
+            function command and the method prologue, split into words.
+        """
+        self.name = name
+        self.min_args = min_args
+        self.n_locals = n_locals
+        self.method = method
+        self.body = body
+
+
+def _as_callee(vm_code: str, threshold: int) -> typing.Optional[Callee]:
+    """
+    Args:
+        vm_code (str): the VM code of a single function.
+        threshold (int): the largest number of commands to inline.
+
+    Returns:
+        typing.Optional[Callee]: the function as a Callee, or None if it
+        cannot or should not be inlined.
+    """
+    lines = vm_code.splitlines()
+    _, name, n_locals = lines[0].split()
+    method = lines[1:3] == METHOD_PROLOGUE
+    body = [line.split() for line in lines[3 if method else 1:]]
+    if len(body) > threshold or not body or body[-1] != ["return"]:
+        return None
+    min_args = 1 if method else 0
+    for words in body:
+        command = words[0]
+        if command in ("call", "function"):
+            return None  # only leaves are inlined
+        if command not in ("push", "pop"):
+            continue
+        segment, index = words[1], int(words[2])
+        if segment == "argument":
+            if method and index == 0 and command == "pop":
+                return None
+            min_args = max(min_args, index + 1)
+        elif segment == "pointer":
+            # A method may only read its object, a function may only use
+            # pointer 1 to access arrays.
+            if method != (index == 0) or method and command == "pop":
+                return None
+        elif segment == "this" and not method or \
+                segment == "that" and method or \
+                segment == "temp" and index >= INLINE_TEMPS[0]:
+            return None
+    if min_args - (1 if method else 0) + int(n_locals) > len(INLINE_TEMPS):
+        return None
+    return Callee(name, min_args, int(n_locals), method, body)
+
+
+class Inliner:
+    """Replaces calls to small leaf subroutines by copies of their bodies.
+    A leaf makes no calls, so inlined bodies never need inlining themselves.
+    """
+
+    def __init__(self, vm_codes: typing.Dict[str, str],
+                 threshold: int = DEFAULT_INLINE_THRESHOLD) -> None:
+        """Creates an inliner for a whole program.
+
+        Args:
+            vm_codes (typing.Dict[str, str]): the VM code of every class of
+            the program, keyed by any name (such as the output path).
+            threshold (int): the largest number of commands a subroutine may
+            have to be inlined, not counting its function command and the
+            prologue of a method.
+        """
+        self.functions = {key: split_functions(vm_code)
+                          for key, vm_code in vm_codes.items()}
+        self.callees = {}
+        for functions in self.functions.values():
+            for name, vm_code in functions:
+                if name:
+                    callee = _as_callee(vm_code, threshold)
+                    if callee is not None:
+                        self.callees[name] = callee
+        self.inlined = 0
+
+    def inline(self, optimize: typing.Optional[typing.Callable] = None) \
+            -> typing.Dict[str, str]:
+        """Inlines every call to a suitable subroutine.
+
+        Args:
+            optimize (typing.Optional[typing.Callable]): if given, a function
+            that optimizes the list of commands of a subroutine, run again
+            over every subroutine that had calls inlined.
+
+        Returns:
+            typing.Dict[str, str]: the new VM code of every class, keyed like
+            the input.
+        """
+        vm_codes = {}
+        for key, functions in self.functions.items():
+            parts = []
+            for name, vm_code in functions:
+                commands = self.inline_function(name, vm_code)
+                if commands is None:
+                    parts.append(vm_code)
+                    continue
+                if optimize is not None:
+                    commands = optimize(commands)
+                parts.append("".join(command + "\n" for command in commands))
+            vm_codes[key] = "".join(parts)
+        return vm_codes
+
+    def inline_function(self, name: str, vm_code: str) \
+            -> typing.Optional[typing.List[str]]:
+        """
+        Args:
+            name (str): the name of the function.
+            vm_code (str): the VM code of the function.
+
+        Returns:
+            typing.Optional[typing.List[str]]: the commands of the function
+            with calls inlined, or None if no call was inlined.
+        """
+        class_name = name.split(".")[0]
+        commands = []
+        count = 0
+        for line in vm_code.splitlines():
+            words = line.split()
+            callee = None
+            if words and words[0] == "call" and words[1] != name:
+                callee = self.callees.get(words[1])
+            if callee is None or \
+                    not self._fits(callee, int(words[2]), class_name):
+                commands.append(line)
+                continue
+            commands.extend(
+                self.expand(callee, int(words[2]), f"INLINE{count}_"))
+            count += 1
+        self.inlined += count
+        return commands if count else None
+
+    @staticmethod
+    def _fits(callee: Callee, n_args: int, class_name: str) -> bool:
+        if n_args < callee.min_args:
+            return False
+        first = 1 if callee.method else 0
+        if n_args - first + callee.n_locals > len(INLINE_TEMPS):
+            return False
+        # A static segment belongs to its class, so a body using statics
+        # only means the same inside its own class.
+        return callee.name.split(".")[0] == class_name or not any(
+            len(words) == 3 and words[1] == "static" for words in callee.body)
+
+    @staticmethod
+    def expand(callee: Callee, n_args: int, prefix: str) -> typing.List[str]:
+        """
+        Args:
+            callee (Callee): the subroutine to inline.
+            n_args (int): the number of arguments the call passes.
+            prefix (str): prepended to the labels of the body, unique within
+            the calling function.
+
+        Returns:
+            typing.List[str]: the commands that replace a call to the callee.
+            They take the arguments off the stack and leave the return value.
+        """
+        first = 1 if callee.method else 0
+        slots = iter(INLINE_TEMPS)
+        arguments = {index: next(slots)
+                     for index in range(first, n_args)}
+        locals_ = {index: next(slots) for index in range(callee.n_locals)}
+        commands = [f"pop temp {arguments[index]}"
+                    for index in reversed(range(first, n_args))]
+        if callee.method:
+            commands.append("pop pointer 1")
+        for slot in locals_.values():  # locals start as 0, as in a call
+            commands.append("push constant 0")
+            commands.append(f"pop temp {slot}")
+        end = f"{prefix}END"
+        end_used = False
+        for position, words in enumerate(callee.body):
+            command = words[0]
+            if command in ("label", "goto", "if-goto"):
+                commands.append(f"{command} {prefix}{words[1]}")
+            elif command == "return":
+                if position != len(callee.body) - 1:
+                    commands.append(f"goto {end}")
+                    end_used = True
+            elif command in ("push", "pop"):
+                segment, index = words[1], int(words[2])
+                if segment == "argument" and index < first or \
+                        segment == "pointer" and callee.method:
+                    segment, index = "pointer", 1  # the object itself
+                elif segment == "argument":
+                    segment, index = "temp", arguments[index]
+                elif segment == "local":
+                    segment, index = "temp", locals_[index]
+                elif segment == "this":
+                    segment = "that"
+                commands.append(f"{command} {segment} {index}")
+            else:
+                commands.append(" ".join(words))
+        if end_used:
+            commands.append(f"label {end}")
+        return commands
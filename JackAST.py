@@ -0,0 +1,299 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+The syntax tree CompilationEngine builds from a Jack class, and the visitor
+classes that walk and rewrite it. Every node lists its children in
+"children", in evaluation order, so generic walks need no per-node code.
+Variables are resolved while parsing: a Variable node holds the symbol
+table entry of its variable, so later passes never look names up again.
+"""
+import typing
+
+
+class Node:
+    """Base class of all syntax tree nodes."""
+
+    __slots__ = ()
+    # Names of the attributes that hold child nodes or lists of child nodes.
+    children = ()
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}"
+                           for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class ClassNode(Node):
+    """class: 'class' className '{' classVarDec* subroutineDec* '}'"""
+
+    __slots__ = ("name", "n_fields", "subroutines")
+    children = ("subroutines",)
+
+    def __init__(self, name: str, n_fields: int,
+                 subroutines: typing.List["SubroutineNode"]) -> None:
+        self.name = name
+        self.n_fields = n_fields
+        self.subroutines = subroutines
+
+
+class SubroutineNode(Node):
+    """subroutineDec: ('constructor' | 'function' | 'method') ('void' | type)
+    subroutineName '(' parameterList ')' subroutineBody
+
+    "symbols" is the subroutine scope of the symbol table, mapping the names
+    of the arguments and locals to their entries.
+    """
+
+    __slots__ = ("kind", "return_type", "name", "body", "n_locals", "symbols")
+    children = ("body",)
+
+    def __init__(self, kind: str, return_type: str, name: str,
+                 body: typing.List["Node"], n_locals: int,
+                 symbols: typing.Dict[str, dict]) -> None:
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        self.body = body
+        self.n_locals = n_locals
+        self.symbols = symbols
+
+
+# Statements
+
+
+class Let(Node):
+    """letStatement: 'let' varName ('[' expression ']')? '=' expression ';'"""
+
+    __slots__ = ("target", "index", "value")
+    children = ("index", "value")
+
+    def __init__(self, target: "Variable", index: typing.Optional[Node],
+                 value: Node) -> None:
+        self.target = target
+        self.index = index
+        self.value = value
+
+
+class If(Node):
+    """ifStatement: 'if' '(' expression ')' '{' statements '}' ('else' '{'
+    statements '}')?
+
+    else_body is None when there is no else clause.
+    """
+
+    __slots__ = ("condition", "then_body", "else_body")
+    children = ("condition", "then_body", "else_body")
+
+    def __init__(self, condition: Node, then_body: typing.List[Node],
+                 else_body: typing.Optional[typing.List[Node]]) -> None:
+        self.condition = condition
+        self.then_body = then_body
+        self.else_body = else_body
+
+
+class While(Node):
+    """whileStatement: 'while' '(' expression ')' '{' statements '}'"""
+
+    __slots__ = ("condition", "body")
+    children = ("condition", "body")
+
+    def __init__(self, condition: Node, body: typing.List[Node]) -> None:
+        self.condition = condition
+        self.body = body
+
+
+class Do(Node):
+    """doStatement: 'do' subroutineCall ';'"""
+
+    __slots__ = ("call",)
+    children = ("call",)
+
+    def __init__(self, call: Node) -> None:
+        self.call = call
+
+
+class Return(Node):
+    """returnStatement: 'return' expression? ';'"""
+
+    __slots__ = ("value",)
+    children = ("value",)
+
+    def __init__(self, value: typing.Optional[Node]) -> None:
+        self.value = value
+
+
+# Expressions
+
+
+class IntConst(Node):
+    """An integer constant. Unlike a literal it may be negative, once
+    constant folding computed it.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+
+class StringConst(Node):
+    """A string constant."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class KeywordConst(Node):
+    """keywordConstant: 'true' | 'false' | 'null' | 'this'"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class Variable(Node):
+    """A variable, with its symbol table entry: a dict holding its "type",
+    its "kind" (the VM segment it lives in) and its "index".
+    """
+
+    __slots__ = ("name", "symbol")
+
+    def __init__(self, name: str, symbol: dict) -> None:
+        self.name = name
+        self.symbol = symbol
+
+    @property
+    def segment(self) -> str:
+        return self.symbol["kind"]
+
+    @property
+    def index(self) -> int:
+        return self.symbol["index"]
+
+
+class ArrayAccess(Node):
+    """varName '[' expression ']'"""
+
+    __slots__ = ("array", "index")
+    children = ("index", "array")
+
+    def __init__(self, array: Variable, index: Node) -> None:
+        self.array = array
+        self.index = index
+
+
+class Call(Node):
+    """subroutineCall, with the full "Class.subroutine" name of its callee.
+    For methods, receiver is the object the method is called on (a Variable,
+    or the 'this' KeywordConst); it is None for functions and constructors.
+    """
+
+    __slots__ = ("name", "receiver", "arguments")
+    children = ("receiver", "arguments")
+
+    def __init__(self, name: str, receiver: typing.Optional[Node],
+                 arguments: typing.List[Node]) -> None:
+        self.name = name
+        self.receiver = receiver
+        self.arguments = arguments
+
+
+class BinaryOp(Node):
+    """term op term. Jack has no operator precedence, so an expression is a
+    left-leaning chain of BinaryOp nodes.
+    """
+
+    __slots__ = ("op", "left", "right")
+    children = ("left", "right")
+
+    def __init__(self, op: str, left: Node, right: Node) -> None:
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class UnaryOp(Node):
+    """unaryOp term"""
+
+    __slots__ = ("op", "operand")
+    children = ("operand",)
+
+    def __init__(self, op: str, operand: Node) -> None:
+        self.op = op
+        self.operand = operand
+
+
+def iter_children(node: Node) -> typing.Iterator[Node]:
+    """
+    Args:
+        node (Node): a syntax tree node.
+
+    Yields:
+        Node: the children of the node, in evaluation order.
+    """
+    for name in node.children:
+        child = getattr(node, name)
+        if child is None:
+            continue
+        if isinstance(child, list):
+            yield from child
+        else:
+            yield child
+
+
+class NodeVisitor:
+    """Walks a syntax tree. visit(node) calls the method named after the
+    node's class, such as visit_While, or generic_visit if there is none.
+    """
+
+    def visit(self, node: Node):
+        """Visits a node and returns whatever its visit method returns."""
+        method = getattr(self, "visit_" + type(node).__name__, None)
+        if method is None:
+            return self.generic_visit(node)
+        return method(node)
+
+    def generic_visit(self, node: Node) -> None:
+        """Visits all children of a node."""
+        for child in iter_children(node):
+            self.visit(child)
+
+
+class NodeTransformer(NodeVisitor):
+    """Walks a syntax tree and rewrites it. Every visit method returns the
+    node that replaces the visited one. Inside a list of statements a visit
+    method may also return a list of nodes, which is spliced in its place,
+    or None to remove the node.
+    """
+
+    def generic_visit(self, node: Node) -> Node:
+        """Visits all children of a node and replaces them in place.
+
+        Returns:
+            Node: the node itself.
+        """
+        for name in node.children:
+            child = getattr(node, name)
+            if child is None:
+                continue
+            if isinstance(child, list):
+                new_children = []
+                for item in child:
+                    result = self.visit(item)
+                    if result is None:
+                        continue
+                    if isinstance(result, list):
+                        new_children.extend(result)
+                    else:
+                        new_children.append(result)
+                child[:] = new_children
+            else:
+                setattr(node, name, self.visit(child))
+        return node
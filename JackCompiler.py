@@ -5,48 +5,868 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import asyncio
+import concurrent.futures
+import cProfile
+import getpass
+import io
+import json
 import os
+import socket
 import sys
+import tempfile
+import time
 import typing
+from AsmWriter import AsmWriter
+from BuildCache import BuildCache, CACHE_DIRECTORY
+from ClassIndex import ClassIndex, check_calls
 from CompilationEngine import CompilationEngine
+from CompilerOptions import CompilerOptions
+from CompilerStats import CompilerStats, optional_phase
+from Inliner import Inliner, DEFAULT_INLINE_THRESHOLD
 from JackTokenizer import JackTokenizer
+from PeepholeOptimizer import PeepholeOptimizer
 from SymbolTable import SymbolTable
+from TreeShaker import TreeShaker, split_functions, call_targets
 from VMWriter import VMWriter
 
+# Part of the build cache keys, bump it whenever the generated code changes.
+COMPILER_VERSION = "1.5"
+# Sources larger than this many bytes are tokenized in chunks rather than
+# being read into memory whole.
+STREAMING_THRESHOLD = 1 << 22
+STREAMING_CHUNK_SIZE = 1 << 16
+# With --watch, how long the sources must stay unchanged before a rebuild,
+# in seconds.
+WATCH_DEBOUNCE = 0.1
+# Where compile servers (see CompileServer.py) listen by default.
+SERVER_SOCKET = os.environ.get("JACK_COMPILER_SOCKET") or os.path.join(
+    tempfile.gettempdir(), f"jackcompiler-{getpass.getuser()}.sock")
+# How long a client waits for the compile server to answer, in seconds,
+# before compiling in process instead.
+SERVER_TIMEOUT = 60.0
+
 
 def compile_file(
-        input_file: typing.TextIO, output_file: typing.TextIO) -> None:
+        input_file: typing.TextIO, output_file: typing.TextIO,
+        chunk_size: typing.Optional[int] = None,
+        options: typing.Optional[CompilerOptions] = None,
+        stats: typing.Optional[CompilerStats] = None) -> CompilationEngine:
     """Compiles a single file.
 
     Args:
         input_file (typing.TextIO): the file to compile.
         output_file (typing.TextIO): writes all output to this file.
+        chunk_size (typing.Optional[int]): if given, the input is tokenized
+            lazily in chunks of this many characters.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        stats (typing.Optional[CompilerStats]): if given, collects the time
+            of every compilation phase.
+
+    Returns:
+        CompilationEngine: the engine that compiled the file.
     """
-    compilation_engine = CompilationEngine(input_file, output_file)
+    compilation_engine = CompilationEngine(
+        input_file, output_file, chunk_size, options, stats=stats)
     compilation_engine.compile_class()
+    return compilation_engine
 
 
+def compile_path(input_path: str,
+                 options: typing.Optional[CompilerOptions] = None,
+                 stats: typing.Optional[CompilerStats] = None,
+                 index: typing.Optional[ClassIndex] = None) -> str:
+    """Compiles a single .jack file on disk.
 
-if "__main__" == __name__:
-    # Parses the input path and calls compile_file on each input file.
-    # This opens both the input and the output files!
-    # Both are closed automatically when the code finishes running.
-    # If the output file does not exist, it is created automatically in the
-    # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: JackCompiler <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    Args:
+        input_path (str): the path of the file to compile.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        stats (typing.Optional[CompilerStats]): if given, collects the time
+            of every compilation phase and of the file.
+        index (typing.Optional[ClassIndex]): if given, the signature of the
+            class is added to it.
+
+    Returns:
+        str: the VM code of the compiled class.
+    """
+    vm_code, signature = _compile_path(input_path, options, stats)
+    if index is not None and signature is not None:
+        index.add(input_path, signature)
+    return vm_code
+
+
+def _compile_path(input_path: str, options: typing.Optional[CompilerOptions],
+                  stats: typing.Optional[CompilerStats]) \
+        -> typing.Tuple[str, typing.Optional[dict]]:
+    # The VM code and the signature of the class, None if there is none.
+    start = time.perf_counter()
+    chunk_size = None
+    if os.path.getsize(input_path) > STREAMING_THRESHOLD:
+        chunk_size = STREAMING_CHUNK_SIZE
+    output_file = io.StringIO()
+    with open(input_path, 'r') as input_file:
+        compilation_engine = compile_file(
+            input_file, output_file, chunk_size, options, stats)
+    if stats is not None:
+        stats.record_file(input_path, time.perf_counter() - start,
+                          compilation_engine.tokenizer.index + 1)
+    return output_file.getvalue(), compilation_engine.signature
+
+
+def _compile_path_in_worker(input_path: str, options: CompilerOptions,
+                            with_stats: bool) -> tuple:
+    # Runs in a worker process, whose signature and statistics are sent back.
+    stats = CompilerStats() if with_stats else None
+    return _compile_path(input_path, options, stats) + (stats,)
+
+
+def find_sources(argument_path: str) -> typing.List[str]:
+    """Lists the .jack files a path refers to.
+
+    Args:
+        argument_path (str): a .jack file or a directory of .jack files.
+
+    Returns:
+        typing.List[str]: the paths of the files to compile, sorted so that
+        the compilation order does not depend on the file system.
+    """
     if os.path.isdir(argument_path):
-        files_to_assemble = [
+        candidates = [
             os.path.join(argument_path, filename)
             for filename in os.listdir(argument_path)]
     else:
-        files_to_assemble = [argument_path]
-    for input_path in files_to_assemble:
-        filename, extension = os.path.splitext(input_path)
-        if extension.lower() != ".jack":
+        candidates = [argument_path]
+    return sorted(path for path in candidates
+                  if os.path.splitext(path)[1].lower() == ".jack")
+
+
+def compile_paths(input_paths: typing.List[str], jobs: int = 1,
+                  options: typing.Optional[CompilerOptions] = None,
+                  stats: typing.Optional[CompilerStats] = None,
+                  index: typing.Optional[ClassIndex] = None) \
+        -> typing.Iterator[typing.Tuple[str, typing.Optional[str],
+                                        typing.Optional[BaseException]]]:
+    """Compiles several files, possibly in parallel. Every class is an
+    independent compilation unit, so with jobs > 1 the files are spread over
+    a pool of worker processes.
+
+    Args:
+        input_paths (typing.List[str]): the files to compile.
+        jobs (int): the number of worker processes to use.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        stats (typing.Optional[CompilerStats]): if given, collects the time
+            of every compilation phase and of every file.
+        index (typing.Optional[ClassIndex]): if given, the signatures of the
+            classes are added to it.
+
+    Yields:
+        tuple: (input path, VM code, error) for every file, in the order of
+        input_paths. Exactly one of the VM code and the error is None.
+    """
+    if jobs <= 1 or len(input_paths) <= 1:
+        for input_path in input_paths:
+            try:
+                yield input_path, compile_path(
+                    input_path, options, stats, index), None
+            except Exception as error:
+                yield input_path, None, error
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_compile_path_in_worker, input_path, options,
+                               stats is not None)
+                   for input_path in input_paths]
+        for input_path, future in zip(input_paths, futures):
+            try:
+                vm_code, signature, worker_stats = future.result()
+            except Exception as error:
+                yield input_path, None, error
+                continue
+            if stats is not None:
+                stats.merge(worker_stats)
+            if index is not None and signature is not None:
+                index.add(input_path, signature)
+            yield input_path, vm_code, None
+
+
+def compile_source(source: str,
+                   options: typing.Optional[CompilerOptions] = None,
+                   as_instructions: bool = False) \
+        -> typing.Union[str, typing.List[str]]:
+    """Compiles the source of a single class in memory.
+
+    Args:
+        source (str): the Jack source of the class.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        as_instructions (bool): return a list of VM commands instead of text.
+
+    Returns:
+        typing.Union[str, typing.List[str]]: the VM code of the class.
+    """
+    output_file = io.StringIO()
+    compile_file(io.StringIO(source), output_file, options=options)
+    vm_code = output_file.getvalue()
+    return vm_code.splitlines() if as_instructions else vm_code
+
+
+def compile_classes(sources: typing.Mapping[str, str],
+                    options: typing.Optional[CompilerOptions] = None,
+                    as_instructions: bool = False) \
+        -> typing.Dict[str, tuple]:
+    """Compiles classes held in memory, without touching the disk.
+
+    Args:
+        sources (typing.Mapping[str, str]): the Jack source of every class,
+            keyed by any name, such as the class name.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        as_instructions (bool): give lists of VM commands instead of text.
+
+    Returns:
+        typing.Dict[str, tuple]: (VM code, error) for every name, exactly
+        one of them None.
+    """
+    results = {}
+    for name, source in sources.items():
+        try:
+            results[name] = (compile_source(source, options,
+                                            as_instructions), None)
+        except Exception as error:
+            results[name] = (None, error)
+    return results
+
+
+async def compile_classes_async(
+        sources: typing.Mapping[str, str],
+        options: typing.Optional[CompilerOptions] = None,
+        as_instructions: bool = False,
+        executor: typing.Optional[concurrent.futures.Executor] = None) \
+        -> typing.AsyncIterator[tuple]:
+    """Compiles classes held in memory concurrently, yielding every result
+    as soon as it is ready.
+
+    Args:
+        sources (typing.Mapping[str, str]): the Jack source of every class,
+            keyed by any name, such as the class name.
+        options (typing.Optional[CompilerOptions]): the options to compile
+            with, the defaults if not given.
+        as_instructions (bool): give lists of VM commands instead of text.
+        executor (typing.Optional[concurrent.futures.Executor]): runs the
+            compilations. By default, a pool of one process per CPU is
+            started for the call and shut down after it. Passing a pool
+            shares its processes between calls.
+
+    Yields:
+        tuple: (name, VM code, error) for every class, in the order they
+        finish, with exactly one of the VM code and the error None.
+    """
+    loop = asyncio.get_running_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor()
+    try:
+        names = {loop.run_in_executor(executor, compile_source, source,
+                                      options, as_instructions): name
+                 for name, source in sources.items()}
+        pending = set(names)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                yield names[future], \
+                    None if error is not None else future.result(), error
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def compile_on_server(input_paths: typing.List[str],
+                      options: CompilerOptions,
+                      socket_path: str = SERVER_SOCKET,
+                      index: typing.Optional[ClassIndex] = None,
+                      timeout: float = SERVER_TIMEOUT) \
+        -> typing.Optional[typing.List[tuple]]:
+    """Has a running compile server compile several files.
+
+    Args:
+        input_paths (typing.List[str]): the absolute paths of the files.
+        options (CompilerOptions): the options to compile with.
+        socket_path (str): the socket the server listens on.
+        index (typing.Optional[ClassIndex]): if given, the signatures of the
+            classes are added to it.
+        timeout (float): how long to wait for the server to accept the
+            request or to answer it, in seconds.
+
+    Returns:
+        typing.Optional[typing.List[tuple]]: (input path, VM code, error) for
+        every file, like compile_paths, or None if no server answered in
+        time.
+    """
+    request = {"command": "compile", "paths": input_paths,
+               "options": vars(options)}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(socket_path)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            with connection.makefile('rb') as response_file:
+                response = json.loads(response_file.readline())
+        results = response["results"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if index is not None:
+        for result in results:
+            if result.get("signature") is not None:
+                index.add(result["path"], result["signature"])
+    return [(result["path"], result["vm_code"],
+             None if result["error"] is None else ValueError(result["error"]))
+            for result in results]
+
+
+def inline_calls(results: typing.Dict[str, tuple], threshold: int,
+                 optimize: bool) -> int:
+    """Inlines calls to small leaf subroutines across the compiled classes.
+
+    Args:
+        results (typing.Dict[str, tuple]): (VM code, error, cached) for every
+            input path, updated in place.
+        threshold (int): the largest number of commands of an inlined
+            subroutine.
+        optimize (bool): whether to run the peephole optimizer again over
+            the subroutines calls were inlined into.
+
+    Returns:
+        int: the number of inlined calls.
+    """
+    inliner = Inliner({input_path: vm_code
+                       for input_path, (vm_code, error, _) in results.items()
+                       if error is None}, threshold)
+    vm_codes = inliner.inline(
+        PeepholeOptimizer().optimize if optimize else None)
+    for input_path, vm_code in vm_codes.items():
+        _, error, cached = results[input_path]
+        results[input_path] = (vm_code, error, cached)
+    return inliner.inlined
+
+
+def shake_tree(results: typing.Dict[str, tuple]) -> None:
+    """Removes the subroutines the program never calls from the compiled
+    classes and prints what was removed. Nothing is removed if a class failed
+    to compile, since its calls are unknown.
+
+    Args:
+        results (typing.Dict[str, tuple]): (VM code, error, cached) for every
+            input path, updated in place.
+    """
+    if any(error is not None for _, error, _ in results.values()):
+        print("JackCompiler: not tree shaking, some files failed to compile",
+              file=sys.stderr)
+        return
+    shaker = TreeShaker({input_path: vm_code
+                         for input_path, (vm_code, _, _) in results.items()})
+    if not shaker.reachable():
+        print("JackCompiler: not tree shaking, the program has no Main.main",
+              file=sys.stderr)
+        return
+    vm_codes, dropped = shaker.shake()
+    for input_path, vm_code in vm_codes.items():
+        _, error, cached = results[input_path]
+        results[input_path] = (vm_code, error, cached)
+    print(f"Tree shaking dropped {len(dropped)} of {len(shaker.calls)} "
+          f"subroutines ({sum(size for _, size in dropped)} VM commands)")
+    for name, size in dropped:
+        print(f"  {name} ({size} commands)")
+
+
+def link_assembly(vm_codes: typing.List[str],
+                  library_paths: typing.List[str]) -> str:
+    """Translates a whole program to Hack assembly, together with the
+    bootstrap and runtime code it needs.
+
+    Args:
+        vm_codes (typing.List[str]): the VM code of every class.
+        library_paths (typing.List[str]): .vm files to link in, such as the
+            classes of the OS.
+
+    Returns:
+        str: the Hack assembly of the program.
+    """
+    vm_codes = list(vm_codes)
+    for library_path in library_paths:
+        with open(library_path, 'r') as library_file:
+            vm_codes.append(library_file.read())
+    defined = set()
+    called = set()
+    for vm_code in vm_codes:
+        for name, function_code in split_functions(vm_code):
+            defined.add(name)
+            called |= call_targets(function_code)
+    unresolved = called - defined
+    if unresolved:
+        print(f"JackCompiler: warning: no code for "
+              f"{', '.join(sorted(unresolved))} (link the OS with --os)",
+              file=sys.stderr)
+    output_file = io.StringIO()
+    asm_writer = AsmWriter(output_file)
+    asm_writer.write_bootstrap(
+        "Sys.init" if "Sys.init" in defined else "Main.main")
+    asm_writer.write_runtime()
+    for vm_code in vm_codes:
+        asm_writer.write_vm(vm_code)
+    asm_writer.flush()
+    return output_file.getvalue()
+
+
+def write_assembly(argument_path: str, input_paths: typing.List[str],
+                   results: typing.Dict[str, tuple],
+                   args: argparse.Namespace) -> int:
+    """Links the compiled classes into one .asm file, named after the
+    directory or the file that was compiled.
+
+    Args:
+        argument_path (str): the path given on the command line.
+        input_paths (typing.List[str]): the .jack files of the program.
+        results (typing.Dict[str, tuple]): the compilation result of every
+            input path, as returned by compile_paths.
+        args (argparse.Namespace): the parsed command line.
+
+    Returns:
+        int: the exit code, non-zero if any file failed to compile.
+    """
+    failures = [(input_path, results[input_path][1])
+                for input_path in input_paths
+                if results[input_path][1] is not None]
+    for input_path, error in failures:
+        print(f"JackCompiler: {input_path}: {error}", file=sys.stderr)
+    if failures:
+        print(f"JackCompiler: {len(failures)} of {len(input_paths)} files "
+              f"failed", file=sys.stderr)
+        return 1
+    library_paths = []
+    if args.os:
+        library_paths = sorted(
+            os.path.join(args.os, filename) for filename in os.listdir(args.os)
+            if os.path.splitext(filename)[1].lower() == ".vm")
+    if os.path.isdir(argument_path):
+        output_path = os.path.join(
+            argument_path, os.path.basename(argument_path) + ".asm")
+    else:
+        output_path = os.path.splitext(argument_path)[0] + ".asm"
+    assembly = link_assembly(
+        [results[input_path][0] for input_path in input_paths],
+        library_paths)
+    with open(output_path, 'w') as output_file:
+        output_file.write(assembly)
+    if args.verbose:
+        print(f"{argument_path} -> {output_path}")
+    return 0
+
+
+def options_from(args: argparse.Namespace) -> CompilerOptions:
+    """
+    Args:
+        args (argparse.Namespace): the parsed command line.
+
+    Returns:
+        CompilerOptions: the options the command line asks for.
+    """
+    return CompilerOptions(
+        optimize=args.optimize,
+        strength_reduction=not args.no_strength_reduction,
+        string_pool=args.pool_strings,
+        reuse_locals=args.reuse_locals,
+        hoist_invariants=args.licm)
+
+
+def cache_directory(argument_path: str,
+                    args: argparse.Namespace) -> typing.Optional[str]:
+    """
+    Args:
+        argument_path (str): the path given on the command line.
+        args (argparse.Namespace): the parsed command line.
+
+    Returns:
+        typing.Optional[str]: the directory of the build cache and the class
+        index, or None if the build should not use them.
+    """
+    if args.no_cache:
+        return None
+    return args.cache_dir or os.path.join(
+        argument_path if os.path.isdir(argument_path)
+        else os.path.dirname(argument_path), CACHE_DIRECTORY)
+
+
+def compile_sources(argument_path: str, input_paths: typing.List[str],
+                    args: argparse.Namespace,
+                    stats: typing.Optional[CompilerStats] = None,
+                    index: typing.Optional[ClassIndex] = None) \
+        -> typing.Dict[str, tuple]:
+    """Compiles files, taking unchanged ones from the build cache.
+
+    Args:
+        argument_path (str): the path given on the command line.
+        input_paths (typing.List[str]): the files to compile.
+        args (argparse.Namespace): the parsed command line.
+        stats (typing.Optional[CompilerStats]): if given, collects where the
+            build spends its time.
+        index (typing.Optional[ClassIndex]): if given, the signatures of the
+            compiled classes are added to it.
+
+    Returns:
+        typing.Dict[str, tuple]: (VM code, error, cached) for every input
+        path, with exactly one of the VM code and the error None.
+    """
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    options = options_from(args)
+    cache_salt = f"{COMPILER_VERSION};{options.fingerprint()}"
+
+    # Unchanged files are taken from the build cache, the rest is compiled.
+    cache = None
+    keys = {}
+    results = {}
+    directory = cache_directory(argument_path, args)
+    if directory is not None:
+        cache = BuildCache(directory)
+    with optional_phase(stats, "cache"):
+        for input_path in input_paths:
+            if cache is not None:
+                keys[input_path] = BuildCache.file_key(input_path, cache_salt)
+                vm_code = cache.get(keys[input_path])
+                if vm_code is not None:
+                    results[input_path] = (vm_code, None, True)
+                    if stats is not None:
+                        stats.record_file(input_path, 0.0, 0, cached=True)
+    misses = [path for path in input_paths if path not in results]
+    compiled = None
+    if args.server and misses:
+        with optional_phase(stats, "server"):
+            compiled = compile_on_server(misses, options, args.socket,
+                                         index, args.server_timeout)
+        if compiled is None and args.verbose:
+            print("No compile server answered, compiling in process")
+    if compiled is None:
+        compiled = compile_paths(misses, jobs, options, stats, index)
+    for input_path, vm_code, error in compiled:
+        results[input_path] = (vm_code, error, False)
+        if cache is not None and error is None:
+            with optional_phase(stats, "cache"):
+                cache.put(keys[input_path], vm_code)
+    if cache is not None:
+        with optional_phase(stats, "cache"):
+            cache.save()
+    return results
+
+
+def finish_build(argument_path: str, input_paths: typing.List[str],
+                 results: typing.Dict[str, tuple], args: argparse.Namespace,
+                 stats: typing.Optional[CompilerStats] = None,
+                 written: typing.Optional[typing.Dict[str, str]] = None,
+                 signatures: typing.Optional[typing.Dict[str, dict]] = None) \
+        -> int:
+    """Runs the whole-program passes over the compiled classes and writes
+    the output files.
+
+    Args:
+        argument_path (str): the path given on the command line.
+        input_paths (typing.List[str]): the compiled files.
+        results (typing.Dict[str, tuple]): (VM code, error, cached) for every
+            input path, updated in place.
+        args (argparse.Namespace): the parsed command line.
+        stats (typing.Optional[CompilerStats]): if given, collects where the
+            build spends its time and what it generates.
+        written (typing.Optional[typing.Dict[str, str]]): if given, the text
+            last written to every output path. Outputs whose text did not
+            change are not written again, and the dict is updated.
+        signatures (typing.Optional[typing.Dict[str, dict]]): if given, the
+            signature of every class, keyed by path, to check the calls
+            between the classes against.
+
+    Returns:
+        int: the exit code, non-zero if any file failed to compile or calls
+        a subroutine of the program wrongly.
+    """
+    bad_calls = []
+    if signatures:
+        with optional_phase(stats, "check"):
+            bad_calls = check_calls(
+                {input_path: vm_code
+                 for input_path, (vm_code, error, _) in results.items()
+                 if error is None},
+                {signature["name"]: signature
+                 for signature in signatures.values()})
+    for input_path, message in bad_calls:
+        print(f"JackCompiler: {input_path}: {message}", file=sys.stderr)
+    if args.inline:
+        with optional_phase(stats, "inline"):
+            inlined = inline_calls(results, args.inline_threshold,
+                                   args.optimize)
+        if args.verbose:
+            print(f"Inlined {inlined} calls")
+    if args.tree_shake:
+        with optional_phase(stats, "tree-shake"):
+            shake_tree(results)
+    if stats is not None:
+        for vm_code, error, _ in results.values():
+            if error is None:
+                stats.count_code(vm_code)
+
+    if args.target == "asm":
+        with optional_phase(stats, "link"):
+            status = write_assembly(argument_path, input_paths, results, args)
+        return 1 if bad_calls else status
+
+    failures = 0
+    for input_path in input_paths:
+        vm_code, error, cached = results[input_path]
+        if error is not None:
+            failures += 1
+            print(f"JackCompiler: {input_path}: {error}", file=sys.stderr)
             continue
-        output_path = filename + ".vm"
-        with open(input_path, 'r') as input_file, \
-                open(output_path, 'w') as output_file:
-            compile_file(input_file, output_file)
+        # If the output file does not exist, it is created automatically in
+        # the correct path, using the correct filename.
+        output_path = os.path.splitext(input_path)[0] + ".vm"
+        if written is not None:
+            if written.get(output_path) == vm_code:
+                continue
+            written[output_path] = vm_code
+        with optional_phase(stats, "write"):
+            with open(output_path, 'w') as output_file:
+                output_file.write(vm_code)
+        if args.verbose:
+            print(f"{input_path} -> {output_path}"
+                  + (" (cached)" if cached else ""))
+    if failures:
+        print(f"JackCompiler: {failures} of {len(input_paths)} files failed",
+              file=sys.stderr)
+    return 1 if failures or bad_calls else 0
+
+
+def build(args: argparse.Namespace,
+          stats: typing.Optional[CompilerStats] = None) -> int:
+    """Compiles the files the command line asks for and writes the results.
+
+    Args:
+        args (argparse.Namespace): the parsed command line.
+        stats (typing.Optional[CompilerStats]): if given, collects where the
+            build spends its time and what it generates.
+
+    Returns:
+        int: the exit code, non-zero if any file failed to compile.
+    """
+    argument_path = os.path.abspath(args.path)
+    input_paths = find_sources(argument_path)
+    # Compiled classes add their signature to the index, the signatures of
+    # cached ones are kept there from when they were compiled.
+    index = ClassIndex(cache_directory(argument_path, args),
+                       max_scan_size=STREAMING_THRESHOLD)
+    results = compile_sources(argument_path, input_paths, args, stats, index)
+    with optional_phase(stats, "index"):
+        signatures = index.signatures(input_paths)
+        index.save()
+    return finish_build(argument_path, input_paths, results, args, stats,
+                        signatures=signatures)
+
+
+def snapshot(input_paths: typing.List[str]) \
+        -> typing.Dict[str, typing.Tuple[int, int]]:
+    """
+    Args:
+        input_paths (typing.List[str]): paths of files.
+
+    Returns:
+        typing.Dict[str, typing.Tuple[int, int]]: the modification time and
+        size of every file that still exists.
+    """
+    snapshots = {}
+    for input_path in input_paths:
+        try:
+            status = os.stat(input_path)
+        except OSError:
+            continue  # removed since it was listed
+        snapshots[input_path] = (status.st_mtime_ns, status.st_size)
+    return snapshots
+
+
+def watch(args: argparse.Namespace) -> int:
+    """Builds, then polls the sources and rebuilds whenever they change,
+    until interrupted.
+
+    Only the files that changed are compiled again, the other classes are
+    kept in memory. The calls between classes are checked, and the
+    whole-program passes (--inline, --tree-shake and --target asm) run, over
+    all classes on every rebuild, since a change in one class can break or
+    change the code of the classes that call it. Only the outputs whose text
+    changed are written.
+
+    Args:
+        args (argparse.Namespace): the parsed command line.
+
+    Returns:
+        int: the exit code.
+    """
+    argument_path = os.path.abspath(args.path)
+    index = ClassIndex(cache_directory(argument_path, args),
+                       max_scan_size=STREAMING_THRESHOLD)
+    compiled = {}
+    snapshots = {}
+    written = {}
+    try:
+        while True:
+            current = snapshot(find_sources(argument_path))
+            changed = [path for path, state in current.items()
+                       if snapshots.get(path) != state]
+            if not changed and current.keys() == snapshots.keys():
+                time.sleep(args.watch_interval)
+                continue
+            # Editors save in several steps, wait until the files settle.
+            while True:
+                time.sleep(WATCH_DEBOUNCE)
+                settled = snapshot(find_sources(argument_path))
+                if settled == current:
+                    break
+                changed = [path for path, state in settled.items()
+                           if snapshots.get(path) != state]
+                current = settled
+            start = time.perf_counter()
+            snapshots = current
+            input_paths = sorted(current)
+            compiled = {path: compiled[path] for path in input_paths
+                        if path in compiled and path not in changed}
+            compiled.update(compile_sources(
+                argument_path, sorted(changed), args, index=index))
+            signatures = index.signatures(input_paths)
+            index.save()
+            before = dict(written)
+            status = finish_build(argument_path, input_paths, dict(compiled),
+                                  args, written=written,
+                                  signatures=signatures)
+            updated = [os.path.basename(path) for path in sorted(written)
+                       if written[path] != before.get(path)]
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"[watch] {len(changed)} changed, "
+                  f"{len(updated)} written ({', '.join(updated) or 'none'})"
+                  f"{'' if status == 0 else ', with errors'} "
+                  f"in {elapsed:.0f} ms", flush=True)
+    except KeyboardInterrupt:
+        return 0
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Parses the command line and compiles the requested files.
+
+    Args:
+        argv (typing.Optional[typing.List[str]]): the command line arguments,
+            sys.argv[1:] by default.
+
+    Returns:
+        int: the exit code, non-zero if any file failed to compile.
+    """
+    parser = argparse.ArgumentParser(
+        prog="JackCompiler", description="Compiles Jack classes to VM code.")
+    parser.add_argument(
+        "path", help="a .jack file or a directory of .jack files")
+    parser.add_argument(
+        "--target", choices=("vm", "asm"), default="vm",
+        help="write a .vm file per class, or link the whole program into a "
+             "single .asm file of Hack assembly")
+    parser.add_argument(
+        "--os", metavar="DIR",
+        help="with --target asm, a directory of the OS .vm files to link in")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, metavar="N",
+        help="compile up to N files in parallel (0: one per CPU)")
+    parser.add_argument(
+        "-O", "--optimize", action="store_true",
+        help="run the peephole optimizer over the generated VM code")
+    parser.add_argument(
+        "--no-strength-reduction", action="store_true",
+        help="always call Math.multiply and Math.divide, for VM "
+             "implementations without shiftleft/shiftright")
+    parser.add_argument(
+        "--pool-strings", action="store_true",
+        help="build every distinct string constant once and reuse it")
+    parser.add_argument(
+        "--reuse-locals", action="store_true",
+        help="let locals that are never live at the same time share a slot")
+    parser.add_argument(
+        "--licm", action="store_true",
+        help="move loop invariant expressions out of while loops")
+    parser.add_argument(
+        "--inline", action="store_true",
+        help="replace calls to small subroutines that call nothing else by "
+             "their bodies, across classes")
+    parser.add_argument(
+        "--inline-threshold", type=int, default=DEFAULT_INLINE_THRESHOLD,
+        metavar="N", help=f"inline subroutines of at most N VM commands "
+                          f"(default: {DEFAULT_INLINE_THRESHOLD})")
+    parser.add_argument(
+        "--tree-shake", action="store_true",
+        help="leave out the subroutines Main.main never calls, and report "
+             "them (compile the whole program directory for this)")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="report every compiled file")
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="report the time of every phase and file, the emitted commands "
+             "by opcode and the largest subroutines")
+    parser.add_argument(
+        "--stats-json", metavar="FILE",
+        help="write the statistics of --stats as JSON to FILE (- for the "
+             "standard output) instead of as tables")
+    parser.add_argument(
+        "--profile", metavar="FILE",
+        help="run the build under cProfile and save the profile to FILE "
+             "(worker processes of -j are not profiled)")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running, and recompile the files that change")
+    parser.add_argument(
+        "--watch-interval", type=float, default=0.5, metavar="SECONDS",
+        help="with --watch, how often to look for changes (default: 0.5)")
+    parser.add_argument(
+        "--server", action="store_true",
+        help="have a running compile server compile the files, or compile "
+             "them in process if none is running")
+    parser.add_argument(
+        "--socket", default=SERVER_SOCKET, metavar="PATH",
+        help=f"the socket of the compile server (default: {SERVER_SOCKET})")
+    parser.add_argument(
+        "--server-timeout", type=float, default=SERVER_TIMEOUT,
+        metavar="SECONDS",
+        help=f"with --server, how long to wait for the server before "
+             f"compiling in process (default: {SERVER_TIMEOUT:g})")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="recompile every file, ignoring the build cache")
+    parser.add_argument(
+        "--cache-dir", metavar="DIR",
+        help=f"where to keep the build cache (default: {CACHE_DIRECTORY} "
+             f"next to the sources)")
+    args = parser.parse_args(argv)
+    if args.watch:
+        return watch(args)
+    stats = CompilerStats() if args.stats or args.stats_json else None
+    if args.profile:
+        profiler = cProfile.Profile()
+        status = profiler.runcall(build, args, stats)
+        profiler.dump_stats(args.profile)
+    else:
+        status = build(args, stats)
+    if args.stats_json == "-":
+        print(stats.to_json())
+    elif args.stats_json:
+        with open(args.stats_json, 'w') as stats_file:
+            stats_file.write(stats.to_json() + "\n")
+    elif stats is not None:
+        print(stats.format_table())
+    return status
+
+if "__main__" == __name__:
+    # Parses the input path and calls compile_file on each input file.
+    sys.exit(main())
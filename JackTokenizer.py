@@ -7,15 +7,161 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 
 import typing
+import collections
 import re
+import sys
+from array import array
 
-COMMENT = r"(//.*)|(/\*([^*]|[\r\n]|(\*+([^*/]|[\r\n])))*\*+/)"  # remove comments
-KEYWORD = re.compile(
-    r"^\s*(class|constructor|function|method|static|field|var|int|char|boolean|void|true|false|null|this|let|do|if|else|while|return)\b\s*")
-SYMBOL = re.compile(r"^\s*([{}()\[\].,;+\-*/&|<>=~])\s*")
-DIGIT = re.compile(r"^\s*(\d+)\s*")
-STRING = re.compile(r'^\s*"(.*?)"\s*')
-IDENTIFIER = re.compile(r"^\s*([a-zA-Z_][a-zA-Z1-9_]*)\s*")
+# Whitespace and comments between tokens: "// ..." and "/* ... */".
+TRIVIA = r"(?:\s+|//[^\n]*|/\*.*?\*/)*"
+# All token patterns combined into a single master pattern. Every group is
+# named after the token type it produces, so match.lastgroup is the type of
+# the matched token. Trailing trivia is consumed together with the token, so
+# after a match the cursor always rests on the next token (or the end).
+# Trivia takes every terminated comment, so a "/*" matched as a token opens
+# a comment that never ends.
+TOKEN_PATTERN = (
+    r"(?:(?P<UNTERMINATED>/\*)"
+    r"|(?P<KEYWORD>(?:class|constructor|function|method|static|field|var|"
+    r"int|char|boolean|void|true|false|null|this|let|do|if|else|while|"
+    r"return)\b)"
+    r"|(?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~^#])"
+    r"|(?P<INT_CONST>\d+)"
+    r'|"(?P<STRING_CONST>[^"\n]*)"'
+    r"|(?P<IDENTIFIER>[a-zA-Z_]\w*))")
+TOKEN = re.compile(TOKEN_PATTERN + TRIVIA, re.DOTALL | re.ASCII)
+LEADING_TRIVIA = re.compile(TRIVIA, re.DOTALL)
+# The streaming scanner handles trivia itself, so it matches bare tokens.
+BARE_TOKEN = re.compile(TOKEN_PATTERN, re.ASCII)
+WHITESPACE = re.compile(r"\s+")
+# Number of characters the streaming scanner reads from its input at a time.
+CHUNK_SIZE = 1 << 16
+
+# Small integer codes of the token types, used by the token buffer and the
+# parser. TOKEN_TYPES maps a code back to the name token_type() returns.
+KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER = range(5)
+TOKEN_TYPES = ("KEYWORD", "SYMBOL", "INT_CONST", "STRING_CONST", "IDENTIFIER")
+TYPE_CODES = {name: code for code, name in enumerate(TOKEN_TYPES)}
+
+
+class TokenBuffer:
+    """A compact, array-backed stream of tokens. Token i is described by
+    three parallel arrays: its type code, its (interned) text and the offset
+    of its first character in the source.
+    """
+
+    __slots__ = ("types", "values", "offsets")
+
+    def __init__(self) -> None:
+        """Creates a new empty token buffer."""
+        self.types = array("B")
+        self.values = []
+        self.offsets = array("l")
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def append(self, type_code: int, value: str, offset: int) -> None:
+        """Appends a token to the end of the buffer.
+
+        Args:
+            type_code (int): the type code of the token.
+            value (str): the text of the token.
+            offset (int): the offset of the token in the source.
+        """
+        self.types.append(type_code)
+        self.values.append(sys.intern(value))
+        self.offsets.append(offset)
+
+
+def tokenize(text: str) -> TokenBuffer:
+    """Breaks a whole Jack source into tokens in a single linear pass.
+
+    Args:
+        text (str): the source to tokenize.
+
+    Returns:
+        TokenBuffer: the tokens of the source, in order.
+    """
+    tokens = TokenBuffer()
+    position = LEADING_TRIVIA.match(text).end()
+    end = len(text)
+    match_token = TOKEN.match
+    while position < end:
+        match = match_token(text, position)
+        if match is None:
+            raise ValueError(f"Invalid token at offset {position}")
+        kind = match.lastgroup
+        try:
+            type_code = TYPE_CODES[kind]
+        except KeyError:  # only UNTERMINATED has no type code
+            raise ValueError("Unterminated comment at end of input")
+        tokens.append(type_code, match.group(kind), match.start(kind))
+        position = match.end()
+    return tokens
+
+
+def scan_stream(input_stream: typing.TextIO, chunk_size: int = CHUNK_SIZE) \
+        -> typing.Iterator[typing.Tuple[int, str, int]]:
+    """Lazily breaks a Jack source into tokens, reading it in fixed-size
+    chunks. Only the unscanned tail of the current chunk is kept in memory,
+    so memory use does not depend on the size of the source. Comments are
+    skipped as they are met, including comments and tokens that cross a
+    chunk boundary.
+
+    Args:
+        input_stream (typing.TextIO): the source to tokenize.
+        chunk_size (int): the number of characters to read at a time.
+
+    Yields:
+        tuple: the type code, text and source offset of every token.
+    """
+    text = ""
+    base = 0  # the source offset of text[0]
+    comment_end = None  # the closing delimiter of an unfinished comment
+    at_eof = False
+    while not at_eof:
+        chunk = input_stream.read(chunk_size)
+        at_eof = not chunk
+        text += chunk
+        position = 0
+        end = len(text)
+        while position < end:
+            if comment_end is not None:
+                close = text.find(comment_end, position)
+                if close < 0:
+                    # Keep the last character, it may start the closing "*/".
+                    position = end if at_eof else max(position, end - 1)
+                    break
+                position = close + len(comment_end)
+                comment_end = None
+            elif text[position].isspace():
+                position = WHITESPACE.match(text, position).end()
+            elif text.startswith("/*", position):
+                comment_end = "*/"
+                position += 2
+            elif text.startswith("//", position):
+                comment_end = "\n"
+                position += 2
+            elif text[position] == "/" and position + 1 == end and not at_eof:
+                break  # may be the first half of a comment opener
+            else:
+                match = BARE_TOKEN.match(text, position)
+                # A token touching the end of the chunk may continue in the
+                # next one, so it is only taken once more input was read.
+                if match is None or (match.end() == end and not at_eof):
+                    if at_eof:
+                        raise ValueError(
+                            f"Invalid token at offset {base + position}")
+                    break
+                kind = match.lastgroup
+                yield TYPE_CODES[kind], match.group(kind), \
+                    base + match.start(kind)
+                position = match.end()
+        text = text[position:]
+        base += position
+    if comment_end == "*/":
+        raise ValueError("Unterminated comment at end of input")
 
 
 class JackTokenizer:
@@ -104,17 +250,27 @@ class JackTokenizer:
 
     def __init__(self, input_stream: typing.TextIO) -> None:
         """Opens the input stream and gets ready to tokenize it."""
-        text = input_stream.read()
-        # Preserve strings while removing comments
-        def preserve_strings_and_remove_comments(match):
-            if match.group(1):  # String constant
-                return match.group(1)
-            return ""  # Remove comments
-
-        pattern = re.compile(r'(".*?")|(/\*.*?\*/|//.*?$)', re.DOTALL | re.MULTILINE)
-        self.text = pattern.sub(preserve_strings_and_remove_comments, text)
+        self.tokens = tokenize(input_stream.read())
+        self.index = -1
         self.current_token = None
         self.current_token_type = None
+        self.current_type = None
+
+    @classmethod
+    def from_tokens(cls, tokens: TokenBuffer) -> "JackTokenizer":
+        """Creates a tokenizer over an already scanned token buffer, so that
+        several passes can share the same tokens without scanning again.
+
+        Args:
+            tokens (TokenBuffer): the tokens to walk over.
+        """
+        tokenizer = cls.__new__(cls)
+        tokenizer.tokens = tokens
+        tokenizer.index = -1
+        tokenizer.current_token = None
+        tokenizer.current_token_type = None
+        tokenizer.current_type = None
+        return tokenizer
 
     def has_more_tokens(self) -> bool:
         """Do we have more tokens in the input?
@@ -122,38 +278,47 @@ class JackTokenizer:
         Returns:
             bool: True if there are more tokens, False otherwise.
         """
-        # Your code goes here!
-        return self.text != ""
+        return self.index + 1 < len(self.tokens)
 
     def advance(self) -> None:
         """Gets the next token from the input and makes it the current token. 
         This method should be called if has_more_tokens() is true. 
         Initially there is no current token.
         """
-        # Your code goes here!
-        if self.has_more_tokens():
-            if KEYWORD.match(self.text):
-                self.current_token = KEYWORD.match(self.text).group(1)
-                self.current_token_type = "KEYWORD"
-                self.text = KEYWORD.sub("", self.text)
-            elif SYMBOL.match(self.text):
-                self.current_token = SYMBOL.match(self.text).group(1)
-                self.current_token_type = "SYMBOL"
-                self.text = SYMBOL.sub("", self.text)
-            elif DIGIT.match(self.text):
-                self.current_token = DIGIT.match(self.text).group(1)
-                self.current_token_type = "INT_CONST"
-                self.text = DIGIT.sub("", self.text)
-            elif STRING.match(self.text):
-                self.current_token = STRING.match(self.text).group(1)
-                self.current_token_type = "STRING_CONST"
-                self.text = STRING.sub("", self.text)
-            elif IDENTIFIER.match(self.text):
-                self.current_token = IDENTIFIER.match(self.text).group(1)
-                self.current_token_type = "IDENTIFIER"
-                self.text = IDENTIFIER.sub("", self.text)
-            else:
-                raise ValueError("Invalid token")
+        if not self.has_more_tokens():
+            raise ValueError("Unexpected end of input")
+        self.index += 1
+        self.current_type = self.tokens.types[self.index]
+        self.current_token_type = TOKEN_TYPES[self.current_type]
+        self.current_token = self.tokens.values[self.index]
+
+    def peek(self, k: int = 1) -> str:
+        """
+        Args:
+            k (int): how many tokens to look ahead, 0 is the current token.
+
+        Returns:
+            str: the text of the token k places after the current one, or None
+            if the input ends before it. Does not consume any tokens.
+        """
+        index = self.index + k
+        if 0 <= index < len(self.tokens):
+            return self.tokens.values[index]
+        return None
+
+    def peek_type(self, k: int = 1) -> int:
+        """
+        Args:
+            k (int): how many tokens to look ahead, 0 is the current token.
+
+        Returns:
+            int: the type code of the token k places after the current one, or
+            None if the input ends before it. Does not consume any tokens.
+        """
+        index = self.index + k
+        if 0 <= index < len(self.tokens):
+            return self.tokens.types[index]
+        return None
 
     def token_type(self) -> str:
         """
@@ -224,3 +389,86 @@ class JackTokenizer:
                       double quote or newline '"'
         """
         return self.current_token
+
+
+class StreamingJackTokenizer(JackTokenizer):
+    """A JackTokenizer that scans its input lazily, in fixed-size chunks,
+    instead of reading and tokenizing the whole file up front. Only the
+    tokens that were looked ahead at are kept, so it suits very large
+    sources. Offers the same API as JackTokenizer.
+    """
+
+    def __init__(self, input_stream: typing.TextIO,
+                 chunk_size: int = CHUNK_SIZE) -> None:
+        """Opens the input stream and gets ready to tokenize it."""
+        self.stream = scan_stream(input_stream, chunk_size)
+        self.lookahead = collections.deque()
+        self.index = -1
+        self.current_token = None
+        self.current_token_type = None
+        self.current_type = None
+
+    def _fill(self, count: int) -> bool:
+        """Scans ahead until at least count tokens are waiting in the
+        lookahead window, or the input ends.
+
+        Returns:
+            bool: True if count tokens are available, False otherwise.
+        """
+        while len(self.lookahead) < count:
+            token = next(self.stream, None)
+            if token is None:
+                return False
+            self.lookahead.append(token)
+        return True
+
+    def has_more_tokens(self) -> bool:
+        """Do we have more tokens in the input?
+
+        Returns:
+            bool: True if there are more tokens, False otherwise.
+        """
+        return self._fill(1)
+
+    def advance(self) -> None:
+        """Gets the next token from the input and makes it the current token. 
+        This method should be called if has_more_tokens() is true. 
+        Initially there is no current token.
+        """
+        if not self._fill(1):
+            raise ValueError("Unexpected end of input")
+        type_code, value, _ = self.lookahead.popleft()
+        self.index += 1
+        self.current_type = type_code
+        self.current_token_type = TOKEN_TYPES[type_code]
+        self.current_token = value
+
+    def peek(self, k: int = 1) -> str:
+        """
+        Args:
+            k (int): how many tokens to look ahead, 0 is the current token.
+
+        Returns:
+            str: the text of the token k places after the current one, or None
+            if the input ends before it. Does not consume any tokens.
+        """
+        if k == 0:
+            return self.current_token
+        if self._fill(k):
+            return self.lookahead[k - 1][1]
+        return None
+
+    def peek_type(self, k: int = 1) -> int:
+        """
+        Args:
+            k (int): how many tokens to look ahead, 0 is the current token.
+
+        Returns:
+            int: the type code of the token k places after the current one, or
+            None if the input ends before it. Does not consume any tokens.
+        """
+        if k == 0:
+            return self.current_type
+        if self._fill(k):
+            return self.lookahead[k - 1][0]
+        return None
@@ -0,0 +1,121 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from JackAST import iter_children, Node, Let, If, While, Do, Return, Variable
+
+
+def local_uses(node: typing.Optional[Node]) -> typing.FrozenSet[str]:
+    """
+    Args:
+        node (typing.Optional[Node]): an expression node, or None.
+
+    Returns:
+        typing.FrozenSet[str]: the names of the locals the expression reads.
+    """
+    if node is None:
+        return frozenset()
+    if isinstance(node, Variable):
+        return frozenset((node.name,)) if node.segment == "local" \
+            else frozenset()
+    uses = frozenset()
+    for child in iter_children(node):
+        uses |= local_uses(child)
+    return uses
+
+
+class LocalAllocator:
+    """Assigns the locals of a subroutine to as few slots as possible. A
+    backwards liveness analysis finds the locals that are live whenever a
+    local is assigned. Those interfere with it, and locals that never
+    interfere share a slot.
+    """
+
+    def __init__(self) -> None:
+        """Creates a new local allocator."""
+        self.interference = {}
+
+    def allocate(self, body: typing.List[Node],
+                 symbols: typing.Dict[str, dict]) -> typing.Dict[str, int]:
+        """
+        Args:
+            body (typing.List[Node]): the statements of a subroutine.
+            symbols (typing.Dict[str, dict]): the subroutine scope of the
+            symbol table.
+
+        Returns:
+            typing.Dict[str, int]: the new index of every local.
+        """
+        names = sorted((name for name, symbol in symbols.items()
+                        if symbol["kind"] == "local"),
+                       key=lambda name: symbols[name]["index"])
+        self.interference = {name: set() for name in names}
+        # Locals live on entry are read before being assigned, and rely on
+        # the VM setting them to 0, which all slots are on entry.
+        self.statements(body, frozenset())
+        slots = {}
+        for name in names:  # greedy coloring, in declaration order
+            taken = {slots[other] for other in self.interference[name]
+                     if other in slots}
+            slot = 0
+            while slot in taken:
+                slot += 1
+            slots[name] = slot
+        return slots
+
+    def statements(self, statements: typing.List[Node],
+                   live: typing.FrozenSet[str]) -> typing.FrozenSet[str]:
+        """
+        Args:
+            statements (typing.List[Node]): a sequence of statements.
+            live (typing.FrozenSet[str]): the locals live after them.
+
+        Returns:
+            typing.FrozenSet[str]: the locals live before them.
+        """
+        for statement in reversed(statements):
+            live = self.statement(statement, live)
+        return live
+
+    def statement(self, node: Node,
+                  live: typing.FrozenSet[str]) -> typing.FrozenSet[str]:
+        """
+        Args:
+            node (Node): a statement.
+            live (typing.FrozenSet[str]): the locals live after it.
+
+        Returns:
+            typing.FrozenSet[str]: the locals live before it.
+        """
+        if isinstance(node, Let):
+            target = node.target
+            if node.index is None and target.segment == "local":
+                for other in live - {target.name}:
+                    self.interference[target.name].add(other)
+                    self.interference[other].add(target.name)
+                live = live - {target.name}
+                return live | local_uses(node.value)
+            return live | local_uses(target) | local_uses(node.index) | \
+                local_uses(node.value)
+        if isinstance(node, If):
+            return local_uses(node.condition) | \
+                self.statements(node.then_body, live) | \
+                self.statements(node.else_body or [], live)
+        if isinstance(node, While):
+            # The condition runs before the body and after every iteration,
+            # so iterate until the locals live there stop growing.
+            head = live | local_uses(node.condition)
+            while True:
+                new_head = head | self.statements(node.body, head)
+                if new_head == head:
+                    return head
+                head = new_head
+        if isinstance(node, Do):
+            return live | local_uses(node.call)
+        if isinstance(node, Return):
+            return local_uses(node.value)
+        return live
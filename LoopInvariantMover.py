@@ -0,0 +1,152 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from ConstantFolding import constant_value
+from JackAST import iter_children, NodeTransformer, Node, Let, While, \
+    IntConst, StringConst, KeywordConst, Variable, ArrayAccess, Call, \
+    BinaryOp, UnaryOp
+from SymbolTable import SymbolTable
+
+# Operators that never fail and never change anything. "*" calls
+# Math.multiply, which has no effects either.
+PURE_OPERATORS = ("+", "-", "*", "&", "|", "<", ">", "=", "~", "^", "#")
+# Locals created for hoisted expressions are named after this prefix, which
+# no Jack identifier can start with.
+HOISTED_PREFIX = "$licm"
+
+
+def expression_key(node: Node) -> tuple:
+    """
+    Returns:
+        tuple: a key that is equal for two expressions of the same shape,
+        operators, constants and variables.
+    """
+    if isinstance(node, Variable):
+        return "Variable", node.segment, node.index
+    own = tuple(getattr(node, name) for name in ("op", "value", "name")
+                if name in node.__slots__)
+    return (type(node).__name__,) + own + \
+        tuple(expression_key(child) for child in iter_children(node))
+
+
+class _Loop:
+    """What the statements of a loop may change."""
+
+    def __init__(self, node: While) -> None:
+        self.assigned = set()
+        self.writes_memory = False
+        self._scan(node)
+
+    def _scan(self, node: Node) -> None:
+        if isinstance(node, Let):
+            if node.index is None:
+                self.assigned.add((node.target.segment, node.target.index))
+            else:
+                self.writes_memory = True
+        elif isinstance(node, (Call, StringConst)):
+            self.writes_memory = True  # anything may happen in a subroutine
+        for child in iter_children(node):
+            self._scan(child)
+
+
+class LoopInvariantMover(NodeTransformer):
+    """Moves the expressions of a while loop that compute the same value in
+    every iteration to new locals assigned right before the loop. Inner loops
+    are handled first, so an expression may move out of several loops.
+
+    Locals and arguments only change by assignment. Fields, statics and
+    array elements also change through calls and through array writes that
+    may alias them, so they are invariant only in loops without either.
+    """
+
+    def __init__(self, symbol_table: SymbolTable) -> None:
+        """Creates a new mover.
+
+        Args:
+            symbol_table (SymbolTable): the symbol table, whose current
+            subroutine scope receives the new locals.
+        """
+        self.symbol_table = symbol_table
+        self.hoisted = 0
+
+    def visit_While(self, node: While):
+        self.generic_visit(node)
+        loop = _Loop(node)
+        lets = {}
+        self._rewrite_statement(node, loop, lets)
+        return list(lets.values()) + [node]
+
+    def _rewrite_statement(self, node: Node, loop: _Loop,
+                           lets: typing.Dict[tuple, Let]) -> None:
+        for name in node.children:
+            child = getattr(node, name)
+            if isinstance(child, list):
+                for statement in child:
+                    self._rewrite_statement(statement, loop, lets)
+            elif child is not None:
+                setattr(node, name, self._hoist(child, loop, lets))
+
+    def _hoist(self, node: Node, loop: _Loop,
+               lets: typing.Dict[tuple, Let]) -> Node:
+        """
+        Returns:
+            Node: the expression, or a new local holding its value if it is
+            loop invariant and worth moving.
+        """
+        if self._invariant(node, loop) and self._worth_hoisting(node):
+            key = expression_key(node)
+            if key not in lets:
+                name = f"{HOISTED_PREFIX}{self.hoisted}"
+                self.hoisted += 1
+                self.symbol_table.define(name, "int", "var")
+                lets[key] = Let(
+                    Variable(name, self.symbol_table.lookup(name)), None, node)
+            return Variable(lets[key].target.name, lets[key].target.symbol)
+        for name in node.children:
+            child = getattr(node, name)
+            if isinstance(child, list):
+                child[:] = [self._hoist(item, loop, lets) for item in child]
+            elif child is not None:
+                setattr(node, name, self._hoist(child, loop, lets))
+        return node
+
+    def _invariant(self, node: Node, loop: _Loop) -> bool:
+        if isinstance(node, (IntConst, KeywordConst)):
+            return True
+        if isinstance(node, Variable):
+            return (node.segment, node.index) not in loop.assigned and \
+                (node.segment in ("local", "argument") or
+                 not loop.writes_memory)
+        if isinstance(node, ArrayAccess):
+            return not loop.writes_memory and \
+                self._invariant(node.array, loop) and \
+                self._invariant(node.index, loop)
+        if isinstance(node, BinaryOp):
+            divisor = constant_value(node.right)
+            if node.op not in PURE_OPERATORS and \
+                    (node.op != "/" or not divisor):
+                return False  # Math.divide fails on 0
+            return self._invariant(node.left, loop) and \
+                self._invariant(node.right, loop)
+        if isinstance(node, UnaryOp):
+            return self._invariant(node.operand, loop)
+        return False
+
+    @staticmethod
+    def _worth_hoisting(node: Node) -> bool:
+        # A single variable or constant is pushed by one command anyway, and
+        # expressions of constants only are folded.
+        if not isinstance(node, (ArrayAccess, BinaryOp, UnaryOp)):
+            return False
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if isinstance(current, (Variable, ArrayAccess)):
+                return True
+            pending.extend(iter_children(current))
+        return False
@@ -0,0 +1,233 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+# Commands that leave exactly 0 (false) or -1 (true) on the stack.
+COMPARISONS = ("eq", "lt", "gt")
+# Commands after which control never falls through to the next command.
+JUMPS = ("goto", "return")
+# Commands that add a constant operand but leave the other one unchanged.
+IDENTITIES = (("push constant 0", "add"), ("push constant 0", "sub"),
+              ("push constant 0", "or"))
+
+
+def _push_pop(window):
+    # push S i; pop S i stores a value right back where it came from.
+    push, pop = window
+    if push[0] == "push" and pop[0] == "pop" and push[1:] == pop[1:]:
+        return []
+
+
+def _double_negation(window):
+    # not; not and neg; neg cancel out.
+    if window[0] == window[1] and window[0][0] in ("not", "neg"):
+        return []
+
+
+def _identity(window):
+    # x + 0, x - 0 and x | 0 are just x.
+    if (" ".join(window[0]), window[1][0]) in IDENTITIES:
+        return []
+
+
+def _constant_branch(window):
+    # A jump on false never happens.
+    if window[0] == ["push", "constant", "0"] and window[1][0] == "if-goto":
+        return []
+
+
+def _true_branch(window):
+    # A jump on true always happens.
+    if window[0] == ["push", "constant", "0"] and window[1] == ["not"] and \
+            window[2][0] == "if-goto":
+        return [f"goto {window[2][1]}"]
+
+
+def _jump_to_next(window):
+    # goto L; label L
+    if window[0][0] == "goto" and window[1][0] == "label" and \
+            window[0][1] == window[1][1]:
+        return [f"label {window[1][1]}"]
+
+
+def _unreachable(window):
+    # Nothing after a goto or a return runs until the next label.
+    if window[0][0] in JUMPS and window[1][0] not in ("label", "function"):
+        return [" ".join(window[0])]
+
+
+def _branch_over_jump(window):
+    # cmp; if-goto A; goto B; label A jumps twice where one inverted jump
+    # does. Only a comparison guarantees a 0/-1 value "not" can invert.
+    compare, branch, jump, label = window
+    if compare[0] in COMPARISONS and branch[0] == "if-goto" and \
+            jump[0] == "goto" and label[0] == "label" and \
+            branch[1] == label[1]:
+        return [compare[0], "not", f"if-goto {jump[1]}", f"label {label[1]}"]
+
+
+def _negated_branch_over_jump(window):
+    # cmp; not; if-goto A; goto B; label A is cmp; if-goto B; label A.
+    compare, negate, branch, jump, label = window
+    if compare[0] in COMPARISONS and negate == ["not"] and \
+            branch[0] == "if-goto" and jump[0] == "goto" and \
+            label[0] == "label" and branch[1] == label[1]:
+        return [compare[0], f"if-goto {jump[1]}", f"label {label[1]}"]
+
+
+# The rewrite rules, as (window size, rule) pairs. A rule gets a window of
+# consecutive commands, each split into its words, and returns the commands
+# that replace the window, or None if it does not apply.
+RULES = [
+    (2, _push_pop),
+    (2, _double_negation),
+    (2, _identity),
+    (2, _constant_branch),
+    (3, _true_branch),
+    (2, _jump_to_next),
+    (2, _unreachable),
+    (5, _negated_branch_over_jump),
+    (4, _branch_over_jump),
+]
+
+
+class PeepholeOptimizer:
+    """Rewrites the VM commands of a subroutine into fewer, equivalent
+    commands, by matching a table of rules against every window of
+    consecutive commands until none applies anymore.
+    """
+
+    def __init__(self, rules: typing.List[typing.Tuple[int, typing.Callable]]
+                 = RULES) -> None:
+        """Creates a new optimizer.
+
+        Args:
+            rules (list): the (window size, rule) pairs to apply, RULES by
+            default.
+        """
+        self.rules = rules
+
+    def optimize(self, instructions: typing.List[str]) -> typing.List[str]:
+        """Optimizes the commands of a single subroutine.
+
+        Args:
+            instructions (typing.List[str]): the commands to optimize.
+
+        Returns:
+            typing.List[str]: the optimized commands.
+        """
+        commands = list(instructions)
+        words = [command.split() for command in commands]
+        backtrack = max((size for size, _ in self.rules), default=1) - 1
+        changed = True
+        while changed:
+            changed = False
+            position = 0
+            while position < len(commands):
+                for size, rule in self.rules:
+                    window = words[position:position + size]
+                    if len(window) < size:
+                        continue
+                    replacement = rule(window)
+                    if replacement is None:
+                        continue
+                    commands[position:position + size] = replacement
+                    words[position:position + size] = \
+                        [command.split() for command in replacement]
+                    position = max(position - backtrack, 0)
+                    break
+                else:
+                    position += 1
+            changed = self._thread_jumps(commands, words) | \
+                self._remove_unused_labels(commands, words)
+        return commands
+
+    @staticmethod
+    def _thread_jumps(commands, words) -> bool:
+        """Makes jumps to a goto or a return jump to its target or return
+        right away, and removes gotos to the next command.
+
+        Returns:
+            bool: True if a jump was changed, False otherwise.
+        """
+        positions = {command[1]: index for index, command in enumerate(words)
+                     if command[0] == "label"}
+
+        def destination(label):
+            # The first command that is not a label, after label L.
+            index = positions[label] + 1
+            while index < len(words) and words[index][0] == "label":
+                index += 1
+            return words[index] if index < len(words) else None
+
+        changed = False
+        for index, command in enumerate(words):
+            if command[0] not in ("goto", "if-goto") or \
+                    command[1] not in positions:
+                continue
+            seen = {command[1]}
+            target = destination(command[1])
+            while target is not None and target[0] == "goto" and \
+                    target[1] in positions and target[1] not in seen:
+                seen.add(target[1])
+                commands[index] = f"{command[0]} {target[1]}"
+                words[index] = command = commands[index].split()
+                target = destination(command[1])
+                changed = True
+            if command[0] == "goto" and target == ["return"]:
+                commands[index] = "return"
+                words[index] = ["return"]
+                changed = True
+        for index in reversed(range(len(words))):
+            if words[index][0] != "goto":
+                continue
+            following = index + 1
+            while following < len(words) and words[following][0] == "label":
+                if words[following][1] == words[index][1]:
+                    del commands[index]
+                    del words[index]
+                    changed = True
+                    break
+                following += 1
+        return changed
+
+    @staticmethod
+    def _remove_unused_labels(commands, words) -> bool:
+        """Removes the labels no jump refers to, which may let more rules
+        apply.
+
+        Returns:
+            bool: True if a label was removed, False otherwise.
+        """
+        targets = {command[1] for command in words
+                   if command[0] in ("goto", "if-goto")}
+        unused = [index for index, command in enumerate(words)
+                  if command[0] == "label" and command[1] not in targets]
+        for index in reversed(unused):
+            del commands[index]
+            del words[index]
+        return bool(unused)
+
+
+def thread_jumps(instructions: typing.List[str]) -> typing.List[str]:
+    """Threads the jumps of a subroutine that lead to other jumps and removes
+    the labels no jump refers to anymore. Unlike PeepholeOptimizer, this
+    changes no other commands.
+
+    Args:
+        instructions (typing.List[str]): the commands of a subroutine.
+
+    Returns:
+        typing.List[str]: the commands with their jumps threaded.
+    """
+    commands = list(instructions)
+    words = [command.split() for command in commands]
+    while PeepholeOptimizer._thread_jumps(commands, words) | \
+            PeepholeOptimizer._remove_unused_labels(commands, words):
+        pass
+    return commands
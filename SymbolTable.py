@@ -116,3 +116,35 @@ class SymbolTable:
             return self.subroutine_table[name]["index"]
         elif name in self.class_table:
             return self.class_table[name]["index"]
+
+    def lookup(self, name: str) -> typing.Optional[dict]:
+        """
+        Args:
+            name (str): name of an identifier.
+
+        Returns:
+            typing.Optional[dict]: the entry of the named identifier in the
+            current scope, holding its "type", "kind" and "index", or None if
+            the identifier is unknown in the current scope.
+        """
+        if name in self.subroutine_table:
+            return self.subroutine_table[name]
+        return self.class_table.get(name)
+
+    def remap(self, indices: typing.Dict[str, int]) -> None:
+        """Assigns new indices to identifiers of the subroutine scope, for
+        instance to let locals share slots. The number of variables of each
+        kind becomes one past the highest index of that kind.
+
+        Args:
+            indices (typing.Dict[str, int]): the new index of every
+            identifier to move, by name.
+        """
+        for name, index in indices.items():
+            self.subroutine_table[name]["index"] = index
+        self.arg_count = max((entry["index"] + 1 for entry
+                              in self.subroutine_table.values()
+                              if entry["kind"] == "argument"), default=0)
+        self.local_count = max((entry["index"] + 1 for entry
+                                in self.subroutine_table.values()
+                                if entry["kind"] == "local"), default=0)
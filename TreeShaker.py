@@ -0,0 +1,122 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+# Where a Jack program starts: the OS's Sys.init calls Main.main.
+ROOTS = ("Main.main", "Sys.init")
+
+
+def split_functions(vm_code: str) -> typing.List[typing.Tuple[str, str]]:
+    """Splits the VM code of a class into its functions.
+
+    Args:
+        vm_code (str): the VM code of a class.
+
+    Returns:
+        typing.List[typing.Tuple[str, str]]: (function name, VM code) for
+        every function, in order. Commands before the first function belong
+        to a function named "".
+    """
+    functions = []
+    name = ""
+    start = 0
+    position = 0
+    for line in vm_code.splitlines(keepends=True):
+        if line.startswith("function "):
+            if position > start:
+                functions.append((name, vm_code[start:position]))
+            name = line.split()[1]
+            start = position
+        position += len(line)
+    if position > start:
+        functions.append((name, vm_code[start:position]))
+    return functions
+
+
+def call_targets(vm_code: str) -> typing.Set[str]:
+    """
+    Args:
+        vm_code (str): VM code.
+
+    Returns:
+        typing.Set[str]: the names of all functions the code calls.
+    """
+    return {line.split()[1] for line in vm_code.splitlines()
+            if line.startswith("call ")}
+
+
+class TreeShaker:
+    """Removes the subroutines a program never calls. The call graph is built
+    from the "call" commands of the compiled classes, and every function that
+    cannot be reached from the roots is dropped. Jack has no function
+    pointers, so this graph is exact up to calls on paths never taken.
+    """
+
+    def __init__(self, vm_codes: typing.Dict[str, str]) -> None:
+        """Creates a tree shaker for a whole program.
+
+        Args:
+            vm_codes (typing.Dict[str, str]): the VM code of every class of
+            the program, keyed by any name (such as the output path).
+        """
+        self.functions = {key: split_functions(vm_code)
+                          for key, vm_code in vm_codes.items()}
+        self.calls = {}
+        for functions in self.functions.values():
+            for name, vm_code in functions:
+                self.calls[name] = call_targets(vm_code)
+
+    def reachable(self, roots: typing.Iterable[str] = ROOTS) \
+            -> typing.Set[str]:
+        """
+        Args:
+            roots (typing.Iterable[str]): the functions the program starts
+            from. Roots the program does not define are ignored.
+
+        Returns:
+            typing.Set[str]: the functions of the program that the roots may
+            call, directly or indirectly, including the roots themselves.
+        """
+        reached = set()
+        pending = [root for root in roots if root in self.calls]
+        while pending:
+            name = pending.pop()
+            if name in reached:
+                continue
+            reached.add(name)
+            pending.extend(target for target in self.calls[name]
+                           if target in self.calls and target not in reached)
+        return reached
+
+    def shake(self, roots: typing.Iterable[str] = ROOTS) \
+            -> typing.Tuple[typing.Dict[str, str],
+                            typing.List[typing.Tuple[str, int]]]:
+        """Drops every function the roots cannot reach.
+
+        Args:
+            roots (typing.Iterable[str]): the functions the program starts
+            from.
+
+        Returns:
+            tuple: the VM code of every class with only its reachable
+            functions left, keyed like the input, and (name, number of VM
+            commands) for every dropped function, in program order.
+        """
+        reached = self.reachable(roots)
+        reached.add("")  # code outside of any function is always kept
+        vm_codes = {}
+        dropped = []
+        for key, functions in self.functions.items():
+            kept = []
+            for name, vm_code in functions:
+                if name in reached:
+                    kept.append(vm_code)
+                else:
+                    dropped.append((name, vm_code.count("\n")))
+            vm_codes[key] = "".join(kept)
+        return vm_codes, dropped
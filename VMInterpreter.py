@@ -0,0 +1,526 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import collections
+import os
+import sys
+import typing
+
+# Memory map of the Hack platform, as used by the VM.
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+MEMORY_SIZE = 32768
+
+# Opcodes of decoded commands.
+(PUSH_CONSTANT, PUSH_SEGMENT, PUSH_FIXED, POP_SEGMENT, POP_FIXED, ADD, SUB,
+ NEG, EQ, GT, LT, AND, OR, NOT, SHIFTLEFT, SHIFTRIGHT, GOTO, IF_GOTO, CALL,
+ CALL_BUILTIN, FUNCTION, RETURN) = range(22)
+SEGMENT_POINTERS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+ARITHMETIC = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT,
+              "lt": LT, "and": AND, "or": OR, "not": NOT,
+              "shiftleft": SHIFTLEFT, "shiftright": SHIFTRIGHT}
+DEFAULT_MAX_STEPS = 10_000_000
+
+
+def wrap(value: int) -> int:
+    """Wraps an integer to a signed 16-bit value."""
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+class VMHalt(Exception):
+    """Raised by the OS stubs to stop the program."""
+
+
+class VMInterpreter:
+    """Loads and runs VM code, counting the commands it executes.
+
+    The OS classes the generated code calls are not run as VM code, they are
+    implemented by fast stubs working on the same memory. Programs are run
+    until they return from their entry point, halt, or exceed a step limit.
+    """
+
+    def __init__(self, sources: typing.Dict[str, str],
+                 keys: typing.Sequence[int] = ()) -> None:
+        """Loads a program.
+
+        Args:
+            sources (typing.Dict[str, str]): maps the name of every .vm file
+            (its class name) to its VM code.
+            keys (typing.Sequence[int]): key codes Keyboard.keyPressed returns
+            in turn, 0 once they run out.
+        """
+        self.code = []
+        self.function_names = []  # the name of the function of every command
+        self.functions = {}
+        self.keys = collections.deque(keys)
+        self.output = []
+        self.trace = []
+        self.builtins = self._builtins()
+        self._load(sources)
+        self.reset()
+
+    def reset(self) -> None:
+        """Clears the memory and the statistics of a previous run."""
+        self.ram = [0] * MEMORY_SIZE
+        self.ram[SP] = STACK_BASE
+        self.heap_top = HEAP_BASE
+        self.steps = 0
+        self.counts = collections.Counter()
+        self.builtin_counts = collections.Counter()
+        self.output = []
+        self.trace = []
+
+    def _load(self, sources: typing.Dict[str, str]) -> None:
+        calls = []
+        static_base = STATIC_BASE
+        for file_name in sorted(sources):
+            statics = {}
+            labels = {}
+            jumps = []
+            function = None
+            for line in sources[file_name].splitlines():
+                words = line.split("//")[0].split()
+                if not words:
+                    continue
+                command = words[0]
+                if command == "label":
+                    labels[(function, words[1])] = len(self.code)
+                    continue
+                if command in ARITHMETIC:
+                    instruction = (ARITHMETIC[command], 0)
+                elif command in ("push", "pop"):
+                    segment, index = words[1], int(words[2])
+                    if segment == "static":
+                        if index not in statics:
+                            statics[index] = static_base
+                            static_base += 1
+                        address = statics[index]
+                    elif segment == "temp":
+                        address = TEMP_BASE + index
+                    elif segment == "pointer":
+                        address = THIS + index
+                    else:
+                        address = None
+                    if command == "push":
+                        if segment == "constant":
+                            instruction = (PUSH_CONSTANT, index)
+                        elif address is None:
+                            instruction = (PUSH_SEGMENT,
+                                           (SEGMENT_POINTERS[segment], index))
+                        else:
+                            instruction = (PUSH_FIXED, address)
+                    elif address is None:
+                        instruction = (POP_SEGMENT,
+                                       (SEGMENT_POINTERS[segment], index))
+                    else:
+                        instruction = (POP_FIXED, address)
+                elif command in ("goto", "if-goto"):
+                    jumps.append((len(self.code), function, words[1]))
+                    instruction = (GOTO if command == "goto" else IF_GOTO,
+                                   None)
+                elif command == "call":
+                    calls.append((len(self.code), words[1], int(words[2])))
+                    instruction = (CALL, None)
+                elif command == "function":
+                    function = words[1]
+                    self.functions[function] = len(self.code)
+                    instruction = (FUNCTION, int(words[2]))
+                elif command == "return":
+                    instruction = (RETURN, 0)
+                else:
+                    raise ValueError(f"{file_name}: unknown command {line!r}")
+                self.code.append(instruction)
+                self.function_names.append(function)
+            for position, function, label in jumps:
+                if (function, label) not in labels:
+                    raise ValueError(f"{file_name}: unknown label {label}")
+                self.code[position] = (self.code[position][0],
+                                       labels[(function, label)])
+        for position, name, n_args in calls:
+            if name in self.functions:
+                self.code[position] = (CALL, (self.functions[name], n_args))
+            elif name in self.builtins:
+                self.code[position] = (CALL_BUILTIN, (name, n_args))
+            else:
+                raise ValueError(f"call to unknown function {name}")
+
+    def run(self, entry: typing.Optional[str] = None,
+            max_steps: int = DEFAULT_MAX_STEPS) -> bool:
+        """Runs the program from its entry point.
+
+        Args:
+            entry (typing.Optional[str]): the function to start at, Sys.init
+            if the program defines it and Main.main otherwise.
+            max_steps (int): the number of commands to run at most.
+
+        Returns:
+            bool: True if the program finished, False if it hit the limit.
+        """
+        if entry is None:
+            entry = "Sys.init" if "Sys.init" in self.functions else "Main.main"
+        if entry not in self.functions:
+            raise ValueError(f"no function {entry} to run")
+        ram = self.ram
+        code = self.code
+        names = self.function_names
+        counts = self.counts
+        # Call the entry point with a return address that ends the run.
+        pc = self._call(self.functions[entry], 0, -1)
+        steps = 0
+        try:
+            while pc >= 0:
+                if steps >= max_steps:
+                    return False
+                steps += 1
+                op, argument = code[pc]
+                counts[names[pc]] += 1
+                pc += 1
+                if op == PUSH_CONSTANT:
+                    ram[ram[SP]] = argument
+                    ram[SP] += 1
+                elif op == PUSH_SEGMENT:
+                    ram[ram[SP]] = ram[ram[argument[0]] + argument[1]]
+                    ram[SP] += 1
+                elif op == PUSH_FIXED:
+                    ram[ram[SP]] = ram[argument]
+                    ram[SP] += 1
+                elif op == POP_SEGMENT:
+                    ram[SP] -= 1
+                    ram[ram[argument[0]] + argument[1]] = ram[ram[SP]]
+                elif op == POP_FIXED:
+                    ram[SP] -= 1
+                    ram[argument] = ram[ram[SP]]
+                elif op <= SHIFTRIGHT:
+                    self._arithmetic(op)
+                elif op == GOTO:
+                    pc = argument
+                elif op == IF_GOTO:
+                    ram[SP] -= 1
+                    if ram[ram[SP]] != 0:
+                        pc = argument
+                elif op == CALL:
+                    pc = self._call(argument[0], argument[1], pc)
+                elif op == CALL_BUILTIN:
+                    name, n_args = argument
+                    ram[SP] -= n_args
+                    args = ram[ram[SP]:ram[SP] + n_args]
+                    self.builtin_counts[name] += 1
+                    ram[ram[SP]] = wrap(self.builtins[name](*args) or 0)
+                    ram[SP] += 1
+                elif op == FUNCTION:
+                    sp = ram[SP]
+                    ram[sp:sp + argument] = [0] * argument
+                    ram[SP] = sp + argument
+                else:  # RETURN
+                    frame = ram[LCL]
+                    return_address = ram[frame - 5]
+                    ram[ram[ARG]] = ram[ram[SP] - 1]
+                    ram[SP] = ram[ARG] + 1
+                    ram[THAT], ram[THIS], ram[ARG], ram[LCL] = \
+                        ram[frame - 1], ram[frame - 2], ram[frame - 3], \
+                        ram[frame - 4]
+                    pc = return_address
+        except VMHalt:
+            pass
+        finally:
+            self.steps += steps
+        return True
+
+    def _call(self, target: int, n_args: int, return_address: int) -> int:
+        ram = self.ram
+        sp = ram[SP]
+        ram[sp:sp + 5] = [return_address, ram[LCL], ram[ARG], ram[THIS],
+                          ram[THAT]]
+        ram[ARG] = sp - n_args
+        ram[LCL] = ram[SP] = sp + 5
+        return target
+
+    def _arithmetic(self, op: int) -> None:
+        ram = self.ram
+        sp = ram[SP]
+        if op == NEG:
+            ram[sp - 1] = wrap(-ram[sp - 1])
+            return
+        if op == NOT:
+            ram[sp - 1] = ~ram[sp - 1]
+            return
+        if op == SHIFTLEFT:
+            ram[sp - 1] = wrap(ram[sp - 1] << 1)
+            return
+        if op == SHIFTRIGHT:
+            ram[sp - 1] = ram[sp - 1] >> 1
+            return
+        x, y = ram[sp - 2], ram[sp - 1]
+        if op == ADD:
+            result = wrap(x + y)
+        elif op == SUB:
+            result = wrap(x - y)
+        elif op == EQ:
+            result = -1 if x == y else 0
+        elif op == GT:
+            result = -1 if x > y else 0
+        elif op == LT:
+            result = -1 if x < y else 0
+        elif op == AND:
+            result = x & y
+        else:
+            result = x | y
+        ram[sp - 2] = result
+        ram[SP] = sp - 1
+
+    # OS stubs
+
+    def _alloc(self, size: int) -> int:
+        if size < 0:
+            raise ValueError("Memory.alloc: negative size")
+        address = self.heap_top
+        self.heap_top += max(size, 1)
+        if self.heap_top > HEAP_END:
+            raise MemoryError("heap overflow")
+        return address
+
+    def _new_string(self, max_length: int) -> int:
+        address = self._alloc(max_length + 2)
+        self.ram[address] = max_length
+        self.ram[address + 1] = 0
+        return address
+
+    def _append_char(self, string: int, char: int) -> int:
+        length = self.ram[string + 1]
+        if length >= self.ram[string]:
+            raise ValueError("String.appendChar: string is full")
+        self.ram[string + 2 + length] = char
+        self.ram[string + 1] = length + 1
+        return string
+
+    def string_value(self, string: int) -> str:
+        """
+        Args:
+            string (int): the address of a String object.
+
+        Returns:
+            str: the characters of the string.
+        """
+        length = self.ram[string + 1]
+        return "".join(chr(char) for char in
+                       self.ram[string + 2:string + 2 + length])
+
+    def _print(self, text: str) -> None:
+        self.output.append(text)
+
+    def _traced(self, name: str, result: int = 0):
+        def stub(*args):
+            self.trace.append((name,) + args)
+            return result
+        return stub
+
+    def _halt(self, *args):
+        self.trace.append(("Sys.halt",) + args)
+        raise VMHalt()
+
+    def _error(self, code: int):
+        self.trace.append(("Sys.error", code))
+        raise VMHalt()
+
+    def _divide(self, x: int, y: int) -> int:
+        if y == 0:
+            self._error(3)
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+
+    def _key_pressed(self) -> int:
+        return self.keys.popleft() if self.keys else 0
+
+    def _string_int_value(self, string: int) -> int:
+        text = self.string_value(string)
+        sign, digits = (-1, text[1:]) if text.startswith("-") else (1, text)
+        value = 0
+        for char in digits:
+            if not char.isdigit():
+                break
+            value = value * 10 + int(char)
+        return sign * value
+
+    def _string_set_int(self, string: int, value: int) -> None:
+        text = str(value)
+        if len(text) > self.ram[string]:
+            raise ValueError("String.setInt: string is too short")
+        self.ram[string + 2:string + 2 + len(text)] = [ord(c) for c in text]
+        self.ram[string + 1] = len(text)
+
+    def _print_string(self, string: int) -> None:
+        text = self.string_value(string)
+        self.trace.append(("Output.printString", text))
+        self._print(text)
+
+    def _print_int(self, value: int) -> None:
+        self.trace.append(("Output.printInt", value))
+        self._print(str(value))
+
+    def _print_char(self, char: int) -> None:
+        self.trace.append(("Output.printChar", char))
+        self._print(chr(char) if 32 <= char < 127 else "\n")
+
+    def _println(self) -> None:
+        self.trace.append(("Output.println",))
+        self._print("\n")
+
+    def _read_int(self, message: int) -> int:
+        self._print_string(message)
+        return self.keys.popleft() if self.keys else 0
+
+    def _builtins(self) -> typing.Dict[str, typing.Callable]:
+        ram_get = lambda address: self.ram[address]
+
+        def poke(address, value):
+            self.ram[address] = value
+
+        def set_char_at(string, index, char):
+            self.ram[string + 2 + index] = char
+
+        def erase_last_char(string):
+            self.ram[string + 1] = max(self.ram[string + 1] - 1, 0)
+
+        def sqrt(x):
+            root = 0
+            while (root + 1) * (root + 1) <= x:
+                root += 1
+            return root
+
+        return {
+            "Math.multiply": lambda x, y: x * y,
+            "Math.divide": self._divide,
+            "Math.min": min,
+            "Math.max": max,
+            "Math.abs": abs,
+            "Math.sqrt": sqrt,
+            "Memory.alloc": self._alloc,
+            "Memory.deAlloc": lambda address: 0,
+            "Memory.peek": ram_get,
+            "Memory.poke": poke,
+            "Array.new": self._alloc,
+            "Array.dispose": lambda array: 0,
+            "String.new": self._new_string,
+            "String.dispose": lambda string: 0,
+            "String.length": lambda string: self.ram[string + 1],
+            "String.charAt": lambda string, i: self.ram[string + 2 + i],
+            "String.setCharAt": set_char_at,
+            "String.appendChar": self._append_char,
+            "String.eraseLastChar": erase_last_char,
+            "String.intValue": self._string_int_value,
+            "String.setInt": self._string_set_int,
+            "String.backSpace": lambda: 129,
+            "String.doubleQuote": lambda: 34,
+            "String.newLine": lambda: 128,
+            "Output.printString": self._print_string,
+            "Output.printInt": self._print_int,
+            "Output.printChar": self._print_char,
+            "Output.println": self._println,
+            "Output.backSpace": self._traced("Output.backSpace"),
+            "Output.moveCursor": self._traced("Output.moveCursor"),
+            "Screen.clearScreen": self._traced("Screen.clearScreen"),
+            "Screen.setColor": self._traced("Screen.setColor"),
+            "Screen.drawPixel": self._traced("Screen.drawPixel"),
+            "Screen.drawLine": self._traced("Screen.drawLine"),
+            "Screen.drawRectangle": self._traced("Screen.drawRectangle"),
+            "Screen.drawCircle": self._traced("Screen.drawCircle"),
+            "Keyboard.keyPressed": self._key_pressed,
+            "Keyboard.readInt": self._read_int,
+            "Sys.halt": self._halt,
+            "Sys.error": self._error,
+            "Sys.wait": self._traced("Sys.wait"),
+        }
+
+
+def load_program(path: str) -> typing.Dict[str, str]:
+    """
+    Args:
+        path (str): a .vm file or a directory of .vm files.
+
+    Returns:
+        typing.Dict[str, str]: the VM code of every file, keyed by its class
+        name.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, filename)
+                 for filename in sorted(os.listdir(path))
+                 if os.path.splitext(filename)[1].lower() == ".vm"]
+    else:
+        paths = [path]
+    sources = {}
+    for vm_path in paths:
+        with open(vm_path, 'r') as vm_file:
+            sources[os.path.splitext(os.path.basename(vm_path))[0]] = \
+                vm_file.read()
+    return sources
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Runs compiled programs and reports the commands they execute.
+
+    Args:
+        argv (typing.Optional[typing.List[str]]): the command line arguments,
+            sys.argv[1:] if None.
+
+    Returns:
+        int: the exit code, non-zero if a program failed to load or run.
+    """
+    parser = argparse.ArgumentParser(
+        prog="VMInterpreter",
+        description="Runs VM programs and counts the commands they execute.")
+    parser.add_argument(
+        "paths", nargs="+",
+        help="a .vm file or a directory of .vm files, one per program")
+    parser.add_argument(
+        "--max-steps", type=int, default=DEFAULT_MAX_STEPS, metavar="N",
+        help=f"stop each program after N commands (default: "
+             f"{DEFAULT_MAX_STEPS})")
+    parser.add_argument(
+        "--keys", default="", metavar="K,K,...",
+        help="key codes Keyboard.keyPressed and Keyboard.readInt return in "
+             "turn")
+    parser.add_argument(
+        "--entry", help="the function to start at (default: Sys.init if "
+                        "defined, Main.main otherwise)")
+    parser.add_argument(
+        "--top", type=int, default=10, metavar="N",
+        help="list the N functions that executed the most commands")
+    parser.add_argument(
+        "--output", action="store_true",
+        help="print what the programs write with Output")
+    args = parser.parse_args(argv)
+    keys = [int(key) for key in args.keys.split(",") if key.strip()]
+
+    failures = 0
+    total = 0
+    for path in args.paths:
+        try:
+            interpreter = VMInterpreter(load_program(path), keys)
+            finished = interpreter.run(args.entry, args.max_steps)
+        except (OSError, ValueError, MemoryError) as error:
+            print(f"VMInterpreter: {path}: {error}", file=sys.stderr)
+            failures += 1
+            continue
+        total += interpreter.steps
+        limit = "" if finished else " (step limit reached)"
+        print(f"{path}: {interpreter.steps} commands{limit}")
+        for name, count in interpreter.counts.most_common(args.top):
+            print(f"  {count:>10}  {name}")
+        if args.output:
+            print("".join(interpreter.output))
+    if len(args.paths) > 1:
+        print(f"total: {total} commands")
+    return 1 if failures else 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
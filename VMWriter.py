@@ -7,11 +7,26 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 import typing
 
+SEGMENTS = ("constant", "argument", "local", "static", "this", "that",
+            "pointer", "temp")
+# The text of push and pop commands up to their index, formatted only once.
+PUSH_COMMANDS = {segment: f"push {segment} " for segment in SEGMENTS}
+POP_COMMANDS = {segment: f"pop {segment} " for segment in SEGMENTS}
+# Once this many characters of finished subroutines are pending, they are
+# written to the output stream in one block.
+FLUSH_THRESHOLD = 1 << 16
+
 
 class VMWriter:
     """
     Writes VM commands into a file. Encapsulates the VM command syntax.
 
+    Commands are not written one by one. The commands of the current
+    subroutine are kept in the instructions list, one preformatted command
+    per item, so they can still be inspected or rewritten in memory. When the
+    subroutine ends they are run through the passes, and the resulting text
+    is written to the output stream in large blocks.
+
     Args:
     command (str): the command to write, can be "ADD", "SUB", "NEG", 
     "EQ", "GT", "LT", "AND", "OR", "NOT", "SHIFTLEFT", "SHIFTRIGHT".
@@ -36,7 +51,37 @@ class VMWriter:
     def __init__(self, output_stream: typing.TextIO) -> None:
         """Creates a new file and prepares it for writing VM commands."""
         self.output_stream = output_stream
-
+        # The commands of the current subroutine, without line breaks.
+        self.instructions = []
+        # Functions that rewrite the commands of a finished subroutine before
+        # it is written, each takes and returns a list of commands.
+        self.passes = []
+        self.pending = []
+        self.pending_size = 0
+
+    def end_subroutine(self) -> None:
+        """Runs the commands of the current subroutine through the passes and
+        queues them for writing.
+        """
+        if not self.instructions:
+            return
+        instructions = self.instructions
+        for rewrite in self.passes:
+            instructions = rewrite(instructions)
+        self.instructions = []
+        block = "\n".join(instructions) + "\n" if instructions else ""
+        self.pending.append(block)
+        self.pending_size += len(block)
+        if self.pending_size >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes every queued command to the output stream."""
+        self.end_subroutine()
+        if self.pending:
+            self.output_stream.write("".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
 
     def write_push(self, segment: str, index: int) -> None:
         """Writes a VM push command.
@@ -46,7 +91,23 @@ class VMWriter:
             "LOCAL", "STATIC", "THIS", "THAT", "POINTER", "TEMP"
             index (int): the index to push to.
         """
-        self.output_stream.write(f"push {segment} {str(index)}\n")
+        command = PUSH_COMMANDS.get(segment) or f"push {segment} "
+        self.instructions.append(command + str(index))
+
+    def write_constant(self, value: int) -> None:
+        """Writes the commands that push a constant, which may be negative.
+
+        Args:
+            value (int): the constant, a signed 16-bit word.
+        """
+        if value >= 0:
+            self.write_push("constant", value)
+        elif value == -32768:
+            self.write_push("constant", 32767)  # ~32767 is -32768
+            self.write_arithmetic("not")
+        else:
+            self.write_push("constant", -value)
+            self.write_arithmetic("neg")
 
     def write_pop(self, segment: str, index: int) -> None:
         """Writes a VM pop command.
@@ -56,7 +117,8 @@ class VMWriter:
             "LOCAL", "STATIC", "THIS", "THAT", "POINTER", "TEMP".
             index (int): the index to pop from.
         """
-        self.output_stream.write(f"pop {segment} {str(index)}\n")
+        command = POP_COMMANDS.get(segment) or f"pop {segment} "
+        self.instructions.append(command + str(index))
 
     def write_arithmetic(self, command: str) -> None:
         """Writes a VM arithmetic command.
@@ -65,7 +127,7 @@ class VMWriter:
             command (str): the command to write, can be "ADD", "SUB", "NEG", 
             "EQ", "GT", "LT", "AND", "OR", "NOT", "SHIFTLEFT", "SHIFTRIGHT".
         """
-        self.output_stream.write(f"{self.arithmetic_commands[command]}\n")
+        self.instructions.append(self.arithmetic_commands[command])
 
     def write_label(self, label: str) -> None:
         """Writes a VM label command.
@@ -73,7 +135,7 @@ class VMWriter:
         Args:
             label (str): the label to write.
         """
-        self.output_stream.write(f"label {label}\n")
+        self.instructions.append("label " + label)
 
     def write_goto(self, label: str) -> None:
         """Writes a VM goto command.
@@ -81,7 +143,7 @@ class VMWriter:
         Args:
             label (str): the label to go to.
         """
-        self.output_stream.write(f"goto {label}\n")
+        self.instructions.append("goto " + label)
 
     def write_if(self, label: str) -> None:
         """Writes a VM if-goto command.
@@ -89,7 +151,7 @@ class VMWriter:
         Args:
             label (str): the label to go to.
         """
-        self.output_stream.write(f"if-goto {label}\n")
+        self.instructions.append("if-goto " + label)
 
     def write_call(self, name: str, n_args: int) -> None:
         """Writes a VM call command.
@@ -98,17 +160,19 @@ class VMWriter:
             name (str): the name of the function to call.
             n_args (int): the number of arguments the function receives.
         """
-        self.output_stream.write(f"call {name} {str(n_args)}\n")
+        self.instructions.append(f"call {name} {n_args}")
 
     def write_function(self, name: str, n_locals: int) -> None:
-        """Writes a VM function command.
+        """Writes a VM function command. This starts a new subroutine, so the
+        commands of the previous one are queued for writing.
 
         Args:
             name (str): the name of the function.
             n_locals (int): the number of local variables the function uses.
         """
-        self.output_stream.write(f"function {name} {str(n_locals)}\n")
+        self.end_subroutine()
+        self.instructions.append(f"function {name} {n_locals}")
 
     def write_return(self) -> None:
         """Writes a VM return command."""
-        self.output_stream.write("return\n")
+        self.instructions.append("return")
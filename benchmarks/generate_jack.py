@@ -0,0 +1,130 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Generates large, valid Jack classes for benchmarking the compiler. Every
+shape stresses a different part of it:
+
+- expressions: deeply nested arithmetic, stressing the recursive parser.
+- subroutines: many small subroutines, stressing the symbol table and the
+  per-subroutine passes.
+- strings: long string literals, stressing the tokenizer and String code.
+- comments: code buried in block and line comments, stressing the scanner.
+
+Usage: python benchmarks/generate_jack.py SHAPE LINES [OUTPUT]
+"""
+import argparse
+import random
+import sys
+import typing
+
+SHAPES = ("expressions", "subroutines", "strings", "comments")
+# Subroutines are cut after about this many lines, like real code.
+SUBROUTINE_LINES = 40
+VARIABLES = ("a", "b", "c", "d")
+
+
+def _expression(rng: random.Random, depth: int) -> str:
+    if depth == 0:
+        return rng.choice(VARIABLES + (str(rng.randrange(1, 1000)),))
+    # Deep on the left and shallow on the right, so lines stay readable.
+    op = rng.choice("+-*&|")
+    return f"({_expression(rng, depth - 1)} {op} " \
+           f"{_expression(rng, rng.randrange(min(depth, 2)))})"
+
+
+def _subroutine_header(name: str) -> typing.List[str]:
+    return [f"    function int {name}(int a, int b) {{",
+            "        var int c, d;",
+            "        let c = a;",
+            "        let d = b;"]
+
+
+def _subroutine_footer() -> typing.List[str]:
+    return ["        return c + d;", "    }"]
+
+
+def _statements(shape: str, rng: random.Random, depth: int,
+                string_length: int) -> typing.List[str]:
+    if shape == "expressions":
+        return [f"        let {rng.choice(VARIABLES)} = "
+                f"{_expression(rng, depth)};"]
+    if shape == "strings":
+        text = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ")
+                       for _ in range(string_length))
+        return [f"        do Output.printString(\"{text}\");"]
+    if shape == "comments":
+        return ["        /** A block comment spanning lines, with code-like",
+                "         *  text inside: let a = b; // and \"quotes\".",
+                "         */",
+                "        let a = a + 1; // a trailing comment",
+                "        // a line comment: if (a) { return; }"]
+    return [f"        let c = c + {rng.randrange(1, 100)};"]
+
+
+def generate(shape: str, lines: int, seed: int = 0, depth: int = 16,
+             string_length: int = 200) -> str:
+    """Generates a single class of about the given number of lines.
+
+    Args:
+        shape (str): one of SHAPES.
+        lines (int): the number of lines to generate, about.
+        seed (int): seeds the random choices, so the output is reproducible.
+        depth (int): the nesting depth of expressions.
+        string_length (int): the length of string literals.
+
+    Returns:
+        str: the source of a Jack class named Main.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape}")
+    rng = random.Random(seed)
+    # Many subroutines means the shortest possible ones.
+    body_lines = 1 if shape == "subroutines" else SUBROUTINE_LINES
+    output = ["class Main {"]
+    count = 0
+    while len(output) < lines - 1:
+        output.extend(_subroutine_header(f"f{count}"))
+        start = len(output)
+        while len(output) - start < body_lines and len(output) < lines - 3:
+            output.extend(_statements(shape, rng, depth, string_length))
+        output.extend(_subroutine_footer())
+        count += 1
+    output.append("}")
+    return "\n".join(output) + "\n"
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Writes a generated class to a file or to the standard output.
+
+    Args:
+        argv (typing.Optional[typing.List[str]]): the command line arguments,
+            sys.argv[1:] if None.
+
+    Returns:
+        int: the exit code.
+    """
+    parser = argparse.ArgumentParser(
+        prog="generate_jack", description="Generates Jack classes.")
+    parser.add_argument("shape", choices=SHAPES)
+    parser.add_argument("lines", type=int)
+    parser.add_argument("output", nargs="?", help="default: standard output")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--depth", type=int, default=16)
+    parser.add_argument("--string-length", type=int, default=200)
+    args = parser.parse_args(argv)
+    source = generate(args.shape, args.lines, args.seed, args.depth,
+                      args.string_length)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
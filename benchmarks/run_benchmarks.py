@@ -0,0 +1,301 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Measures the throughput and peak memory of the compiler stages on generated
+classes, and compares them against a stored baseline:
+
+- tokenizer: JackTokenizer's scan of the whole source.
+- parser: CompilationEngine building the syntax tree from the tokens.
+- codegen: constant folding, CodeGenerator and the VMWriter passes.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 1000,10000] [--update]
+
+The run fails (exit code 1) when a stage gets worse than the baseline by
+more than the threshold. The parser and the code generator are always
+checked relative to the tokenizer of the same run, which holds on any
+machine. Absolute speeds and peak memory are only checked against a
+baseline recorded on the same machine and Python version. Run once with
+--update to record one.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import typing
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# The compiler modules live in the directory above.
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIRECTORY))
+
+from CodeGenerator import CodeGenerator  # noqa: E402
+from CompilationEngine import CompilationEngine  # noqa: E402
+from ConstantFolding import ConstantFolder  # noqa: E402
+from JackTokenizer import JackTokenizer, tokenize  # noqa: E402
+from generate_jack import generate, SHAPES  # noqa: E402
+
+SIZES = (1_000, 10_000, 100_000)
+# Not run by default: the largest inputs take minutes and several GB.
+LARGE_SIZES = (1_000_000,)
+STAGES = ("tokenizer", "parser", "codegen")
+BASELINE_PATH = os.path.join(BENCHMARKS_DIRECTORY, "baseline.json")
+# A stage regresses when it gets slower or bigger than this fraction.
+DEFAULT_THRESHOLD = 0.25
+# Small inputs are run several times and the fastest run is kept, since a
+# single run of a few milliseconds is mostly noise.
+REPEAT_LINES = 10_000
+
+
+def run_stages(source: str) -> typing.Tuple[int, typing.Dict[str, float]]:
+    """Compiles a source once, timing every stage.
+
+    Args:
+        source (str): the source of a class.
+
+    Returns:
+        typing.Tuple[int, typing.Dict[str, float]]: the number of tokens and
+        the seconds every stage took.
+    """
+    seconds = {}
+    start = time.perf_counter()
+    tokens = tokenize(source)
+    seconds["tokenizer"] = time.perf_counter() - start
+
+    engine = CompilationEngine(io.StringIO(""), io.StringIO())
+    engine.tokenizer = JackTokenizer.from_tokens(tokens)
+    start = time.perf_counter()
+    tree = engine.parse_class()
+    seconds["parser"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree = ConstantFolder().visit(tree)
+    CodeGenerator(engine.vm_writer, engine.symbol_table,
+                  engine.options).visit(tree)
+    engine.vm_writer.flush()
+    seconds["codegen"] = time.perf_counter() - start
+    return len(tokens), seconds
+
+
+def peak_memory(source: str) -> typing.Dict[str, int]:
+    """Compiles a source once, tracing the memory of every stage.
+
+    Args:
+        source (str): the source of a class.
+
+    Returns:
+        typing.Dict[str, int]: the peak memory every stage allocated on top
+        of what the earlier stages left, in bytes.
+    """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tokens = tokenize(source)
+        peaks["tokenizer"] = tracemalloc.get_traced_memory()[1] - base
+
+        engine = CompilationEngine(io.StringIO(""), io.StringIO())
+        engine.tokenizer = JackTokenizer.from_tokens(tokens)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        tree = engine.parse_class()
+        peaks["parser"] = tracemalloc.get_traced_memory()[1] - base
+
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        tree = ConstantFolder().visit(tree)
+        CodeGenerator(engine.vm_writer, engine.symbol_table,
+                      engine.options).visit(tree)
+        engine.vm_writer.flush()
+        peaks["codegen"] = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def measure(shape: str, lines: int, memory: bool = True) \
+        -> typing.Dict[str, dict]:
+    """Benchmarks every stage on a generated class.
+
+    Args:
+        shape (str): the shape of the class, one of generate_jack.SHAPES.
+        lines (int): the number of lines of the class.
+        memory (bool): whether to measure peak memory as well, which takes
+            another, slower run.
+
+    Returns:
+        typing.Dict[str, dict]: the results of every stage, keyed by
+        "shape/lines/stage".
+    """
+    source = generate(shape, lines)
+    best = {}
+    n_tokens = 0
+    for _ in range(max(1, REPEAT_LINES // lines)):
+        gc.collect()
+        n_tokens, seconds = run_stages(source)
+        for stage, value in seconds.items():
+            best[stage] = min(best.get(stage, value), value)
+    peaks = peak_memory(source) if memory else {}
+    results = {}
+    for stage in STAGES:
+        result = {"seconds": round(best[stage], 6),
+                  "tokens_per_second": round(n_tokens / best[stage])}
+        if stage in peaks:
+            result["peak_kib"] = round(peaks[stage] / 1024)
+        results[f"{shape}/{lines}/{stage}"] = result
+    return results
+
+
+def machine() -> str:
+    """
+    Returns:
+        str: describes the machine and Python version, which absolute
+        results depend on.
+    """
+    return f"{platform.node()} {platform.machine()} " \
+        f"{platform.python_implementation()} {platform.python_version()}"
+
+
+def relative_speed(results: typing.Dict[str, dict], key: str) -> float:
+    """
+    Args:
+        results (typing.Dict[str, dict]): the results of a run.
+        key (str): a "shape/lines/stage" key of the results.
+
+    Returns:
+        float: the throughput of the stage divided by the throughput of the
+        tokenizer on the same input, which does not depend on the speed of
+        the machine.
+    """
+    tokenizer_key = key.rsplit("/", 1)[0] + "/tokenizer"
+    return results[key]["tokens_per_second"] / \
+        results[tokenizer_key]["tokens_per_second"]
+
+
+def regressions(results: typing.Dict[str, dict],
+                baseline: typing.Dict[str, dict],
+                threshold: float, absolute: bool) -> typing.List[str]:
+    """
+    Args:
+        results (typing.Dict[str, dict]): the results of this run.
+        baseline (typing.Dict[str, dict]): the stored results.
+        threshold (float): the fraction by which a stage may get worse.
+        absolute (bool): whether the baseline was recorded on this machine,
+            so that absolute speeds and memory can be compared too.
+
+    Returns:
+        typing.List[str]: a description of every regression.
+    """
+    found = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        if not key.endswith("/tokenizer"):
+            speed = relative_speed(results, key) / \
+                relative_speed(baseline, key)
+            if speed < 1 - threshold:
+                found.append(f"{key}: {relative_speed(results, key):.2f} "
+                             f"times the tokenizer speed, baseline "
+                             f"{relative_speed(baseline, key):.2f}")
+        if not absolute:
+            continue
+        speed = result["tokens_per_second"] / old["tokens_per_second"]
+        if speed < 1 - threshold:
+            found.append(f"{key}: {result['tokens_per_second']} tokens/s, "
+                         f"baseline {old['tokens_per_second']}")
+        if "peak_kib" in result and "peak_kib" in old and \
+                result["peak_kib"] > old["peak_kib"] * (1 + threshold):
+            found.append(f"{key}: {result['peak_kib']} KiB peak, "
+                         f"baseline {old['peak_kib']}")
+    return found
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Runs the benchmarks and checks them against the baseline.
+
+    Args:
+        argv (typing.Optional[typing.List[str]]): the command line arguments,
+            sys.argv[1:] if None.
+
+    Returns:
+        int: the exit code, non-zero if a stage regressed.
+    """
+    parser = argparse.ArgumentParser(
+        prog="run_benchmarks", description="Benchmarks the compiler stages.")
+    parser.add_argument(
+        "--shapes", default=",".join(SHAPES),
+        help="comma separated shapes to generate (default: all)")
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in SIZES),
+        help=f"comma separated numbers of lines (default: 1k to 100k, "
+             f"{', '.join(str(size) for size in LARGE_SIZES)} needs several "
+             f"GB of memory)")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="fail when a stage gets worse by more than this fraction")
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH,
+        help="the file of stored results")
+    parser.add_argument(
+        "--update", action="store_true",
+        help="store the results of this run as the new baseline")
+    parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip the (slower) peak memory measurement")
+    args = parser.parse_args(argv)
+    shapes = [shape for shape in args.shapes.split(",") if shape]
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    baseline = {}
+    baseline_machine = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            stored = json.load(baseline_file)
+        baseline = stored["results"]
+        baseline_machine = stored.get("machine")
+    absolute = baseline_machine == machine()
+    if not absolute and not args.update:
+        print(f"The baseline was recorded on "
+              f"{baseline_machine or 'another machine'}, only checking "
+              f"speeds relative to the tokenizer (run with --update to "
+              f"record a baseline for this machine)", file=sys.stderr)
+
+    results = {}
+    print(f"{'benchmark':<32}{'seconds':>10}{'tokens/s':>12}"
+          f"{'peak KiB':>10}")
+    for shape in shapes:
+        for lines in sizes:
+            for key, result in measure(shape, lines,
+                                       not args.no_memory).items():
+                results[key] = result
+                print(f"{key:<32}{result['seconds']:>10.3f}"
+                      f"{result['tokens_per_second']:>12}"
+                      f"{result.get('peak_kib', '-'):>10}")
+
+    if args.update:
+        if not absolute:
+            baseline = {}  # results of another machine do not mix
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({"machine": machine(),
+                       "python": platform.python_version(),
+                       "results": dict(sorted(baseline.items()))},
+                      baseline_file, indent=1)
+            baseline_file.write("\n")
+        return 0
+    found = regressions(results, baseline, args.threshold, absolute)
+    for regression in found:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())